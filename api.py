@@ -244,6 +244,49 @@ class AdvancedOptions(BaseModel):
             "(default is 0, always process before any mask invert)"
         ),
     )
+    cfg_skip_after: float = Field(
+        default=1.0,
+        description="Skip the negative prompt after this fraction of sampling, guidance is nearly irrelevant in late steps. Use 1.0 to disable.",
+    )
+    cfg_reuse_interval: int = Field(
+        default=1,
+        description="Evaluate the negative prompt every N steps and reuse it in between. Use 1 to disable.",
+    )
+    sharpness_end: float = Field(
+        default=1.0,
+        description="Stop applying sharpness after this fraction of sampling. Use 1.0 to disable.",
+    )
+    tome_ratio: float = Field(
+        default=0.0,
+        description="Token Merging ratio of self-attention tokens merged in the highest resolution blocks. Use 0.0 to disable. Max 0.9.",
+    )
+    hypertile_enabled: bool = Field(default=False, description="Enable HyperTile tiled self-attention. Ignored when tome_ratio > 0.")
+    hypertile_tile_size: int = Field(default=256, description="HyperTile tile size in pixels. Min 32, Max 2048.")
+    hypertile_max_depth: int = Field(
+        default=0, description="HyperTile is applied to UNet blocks up to this depth (0 is the highest resolution). Max 3."
+    )
+    deep_cache_interval: int = Field(
+        default=-1,
+        description="Run the full UNet every N steps and reuse its deep features in between. Use -1 for the performance default, 1 to disable.",
+    )
+    deep_cache_depth: int = Field(
+        default=-1,
+        description="Number of shallow UNet blocks recomputed on cached steps. Use -1 for the performance default. Max 8.",
+    )
+    preview_method: str = Field(
+        default=modules.config.default_preview_method,
+        description=f"Backend used to render previews during generation. Options are: {flags.preview_methods}.",
+    )
+    upscale_model: str = Field(
+        default=flags.upscale_model_default,
+        description="Model used by Upscale and Fast Upscale. Use a file name from the upscale models folder, "
+        "for example a compact SRVGG model for speed, or Default for the Fooocus ESRGAN.",
+    )
+    latent_upscale_method: str = Field(
+        default=flags.disabled,
+        description="Upscale (1.5x) and Upscale (2x) resize the latent with this method instead of running the upscale model "
+        f"and encoding the large image. Options are: {flags.latent_upscale_methods}",
+    )
 
 
 class GenerationOption(BaseModel):
@@ -350,6 +393,7 @@ class DefaultOptions(BaseModel):
     refiner_switch: float = Field(description="When to switch to a refiner model. Value needs to be between 0.0 ~ 1.0")
     loras: list[LoraOptions] = Field(description="Lora options.")
     uovs: OptionList = Field(description="Upscale or variation options.")
+    upscale_models: OptionList = Field(description="Upscale model options.")
     ip_types: OptionList = Field(description="Image prompt Control Types.")
     ip_default_options: dict[str, ImagePromptOptions] = Field(description="Image prompt default options.")
     num_image_prompts: int = Field(description="Number of image prompts.")
@@ -633,6 +677,18 @@ def convert_advanced_options_to_list(advanced_options: AdvancedOptions) -> list:
         advanced_options.inpaint_mask_upload_checkbox,
         advanced_options.invert_mask_checkbox,
         advanced_options.inpaint_erode_or_dilate,
+        advanced_options.cfg_skip_after,
+        advanced_options.cfg_reuse_interval,
+        advanced_options.sharpness_end,
+        advanced_options.tome_ratio,
+        advanced_options.hypertile_enabled,
+        advanced_options.hypertile_tile_size,
+        advanced_options.hypertile_max_depth,
+        advanced_options.deep_cache_interval,
+        advanced_options.deep_cache_depth,
+        advanced_options.preview_method,
+        advanced_options.upscale_model,
+        advanced_options.latent_upscale_method,
     ]
 
 
@@ -1058,6 +1114,10 @@ def create_api(
             refiner_switch=config_dict.get("default_refiner_switch", modules.config.default_refiner_switch),
             loras=lora_options,
             uovs=OptionList(default=flags.disabled, options=flags.uov_list),
+            upscale_models=OptionList(
+                default=flags.upscale_model_default,
+                options=config_dict.get("upscale_model_filenames", modules.config.upscale_model_filenames),
+            ),
             ip_types=OptionList(default=flags.default_ip, options=flags.ip_list),
             ip_default_options={
                 ip_type: ImagePromptOptions(
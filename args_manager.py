@@ -26,6 +26,23 @@ args_parser.parser.add_argument("--disable-preset-download", action='store_true'
 args_parser.parser.add_argument("--always-download-new-model", action='store_true',
                                 help="Always download newer models ", default=False)
 
+args_parser.parser.add_argument("--expansion-backend", type=str, default='default', choices=['default', 'cpu-int8'],
+                                help="Backend of the Fooocus V2 prompt expansion. "
+                                  "[cpu-int8] runs an int8 dynamically quantized model on CPU, "
+                                  "keeping it out of the GPU memory budget.")
+
+args_parser.parser.add_argument("--compile-unet", action='store_true',
+                                help="Compile the UNet with torch.compile, once per resolution and batch size. "
+                                  "The first step of each new shape is slower.", default=False)
+
+args_parser.parser.add_argument("--preview-fps", type=float, default=5.0,
+                                help="Maximum number of previews rendered per second. "
+                                  "Previews are rendered on a side thread from the latest step only.")
+
+args_parser.parser.add_argument("--vae-stream-decode", action='store_true',
+                                help="Decode images of 2048px and more in bands straight into uint8 to save memory. "
+                                  "The result slightly differs from a full decode.", default=False)
+
 args_parser.parser.set_defaults(
     disable_cuda_malloc=True,
     in_browser=True,
@@ -0,0 +1,66 @@
+import time
+import torch
+
+import modules.anisotropic as anisotropic
+
+from torch.nn.functional import pad
+
+
+def bilateral_blur_legacy(input, guidance, kernel_size, sigma_color, sigma_space, border_type='reflect'):
+    if isinstance(sigma_color, torch.Tensor):
+        sigma_color = sigma_color.to(device=input.device, dtype=input.dtype).view(-1, 1, 1, 1, 1)
+
+    ky, kx = anisotropic._unpack_2d_ks(kernel_size)
+    pad_y, pad_x = anisotropic._compute_zero_padding(kernel_size)
+
+    padded_input = pad(input, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
+    unfolded_input = padded_input.unfold(2, ky, 1).unfold(3, kx, 1).flatten(-2)
+    padded_guidance = pad(guidance, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
+    unfolded_guidance = padded_guidance.unfold(2, ky, 1).unfold(3, kx, 1).flatten(-2)
+
+    diff = unfolded_guidance - guidance.unsqueeze(-1)
+    color_distance_sq = diff.abs().sum(1, keepdim=True).square()
+    color_kernel = (-0.5 / sigma_color**2 * color_distance_sq).exp()
+
+    space_kernel = anisotropic.get_gaussian_kernel2d(kernel_size, sigma_space, device=input.device, dtype=input.dtype)
+    space_kernel = space_kernel.view(-1, 1, 1, 1, kx * ky)
+
+    kernel = space_kernel * color_kernel
+    return (unfolded_input * kernel).sum(-1) / kernel.sum(-1)
+
+
+def measure(fn, device, repeat):
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    elapsed = (time.perf_counter() - t) / repeat * 1000.0
+    peak = torch.cuda.max_memory_allocated() / 1024 ** 2 if device.type == 'cuda' else float('nan')
+    return result, elapsed, peak
+
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+dtype = torch.float16 if device.type == 'cuda' else torch.float32
+repeat = 5
+
+# SDXL latents: 1024x1024 -> 128x128, 1152x896 -> 144x112, 1536x1536 -> 192x192
+for batch, height, width in [(2, 128, 128), (2, 144, 112), (2, 192, 192), (4, 128, 128)]:
+    torch.manual_seed(0)
+    eps = torch.randn(batch, 4, height, width, device=device, dtype=dtype)
+    x0 = torch.randn(batch, 4, height, width, device=device, dtype=dtype)
+    s, m = torch.std_mean(x0, dim=(1, 2, 3), keepdim=True)
+    guidance = (x0 - m) / (s + 1e-5)
+
+    with torch.no_grad():
+        legacy, legacy_ms, legacy_mb = measure(
+            lambda: bilateral_blur_legacy(eps, guidance, (13, 13), 3.0, (3.0, 3.0)), device, repeat)
+        current, current_ms, current_mb = measure(
+            lambda: anisotropic.joint_bilateral_blur(eps, guidance, (13, 13), 3.0, (3.0, 3.0)), device, repeat)
+
+    diff = (legacy.float() - current.float()).abs().max().item()
+    print(f'{batch}x4x{height}x{width}: legacy {legacy_ms:.1f} ms / {legacy_mb:.0f} MB, '
+          f'row-wise {current_ms:.1f} ms / {current_mb:.0f} MB, max abs diff {diff:.2e}')
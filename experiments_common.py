@@ -0,0 +1,55 @@
+import time
+import numpy as np
+
+import modules.config
+import modules.patch
+import modules.advanced_parameters as advanced_parameters
+import modules.default_pipeline as pipeline
+
+
+# Shared by the experiments that sample full images: default settings, no previews.
+advanced_parameters.disable_preview = True
+modules.patch.sharpness = modules.config.default_sample_sharpness
+modules.patch.adaptive_cfg = modules.config.default_cfg_tsnr
+
+
+def encode(prompt, negative_prompt='blurry, low quality'):
+    return pipeline.clip_encode([prompt]), pipeline.clip_encode([negative_prompt])
+
+
+def diffuse(conds, steps, width, height, seed, switch=None, **kwargs):
+    positive, negative = conds
+    if switch is None:
+        switch = int(round(steps * modules.config.default_refiner_switch))
+    t = time.perf_counter()
+    images = pipeline.process_diffusion(
+        positive_cond=positive, negative_cond=negative, steps=steps, switch=switch, width=width, height=height,
+        image_seed=seed, callback=lambda *args: None, sampler_name=modules.config.default_sampler,
+        scheduler_name=modules.config.default_scheduler, cfg_scale=modules.config.default_cfg_scale, **kwargs)
+    return images[0], time.perf_counter() - t
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
+
+
+def ssim(a, b):
+    # Global SSIM on luminance, enough to rank the configurations.
+    a, b = a.astype(np.float64).mean(axis=2), b.astype(np.float64).mean(axis=2)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    cov = np.mean((a - a.mean()) * (b - b.mean()))
+    return ((2 * a.mean() * b.mean() + c1) * (2 * cov + c2)) / \
+        ((a.mean() ** 2 + b.mean() ** 2 + c1) * (a.var() + b.var() + c2))
+
+
+def compare(run, seeds, baselines):
+    # Mean time, PSNR and SSIM of run(seed) over the seeds, the first image of each seed is its baseline.
+    elapsed, psnrs, ssims = 0.0, [], []
+    for seed in seeds:
+        image, seconds = run(seed)
+        baselines.setdefault(seed, image)
+        elapsed += seconds
+        psnrs.append(psnr(baselines[seed], image))
+        ssims.append(ssim(baselines[seed], image))
+    return elapsed / len(seeds), float(np.mean(psnrs)), float(np.mean(ssims))
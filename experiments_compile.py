@@ -0,0 +1,51 @@
+import time
+import torch
+
+import modules.patch as patch
+import modules.default_pipeline as pipeline
+import ldm_patched.modules.model_management as model_management
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def timed(fn):
+    synchronize()
+    t = time.perf_counter()
+    fn()
+    synchronize()
+    return time.perf_counter() - t
+
+
+unet = pipeline.final_unet
+model_management.load_models_gpu([unet])
+diffusion_model = unet.model.diffusion_model
+device = unet.load_device
+dtype = unet.model.get_dtype()
+repeat = 5
+
+with torch.inference_mode():
+    # (batch, latent height, latent width), cond and uncond are batched together
+    for batch, height, width in [(2, 128, 128), (2, 112, 144), (4, 128, 128)]:
+        x = torch.randn(batch, 4, height, width, device=device, dtype=dtype)
+        timesteps = torch.full((batch,), 500.0, device=device)
+        context = torch.randn(batch, 77, 2048, device=device, dtype=dtype)
+        y = torch.randn(batch, 2816, device=device, dtype=dtype)
+        options = dict(cond_or_uncond=[0, 1] * (batch // 2), diffusion_progress=0.5)
+
+        def eager():
+            patch.patched_unet_forward(diffusion_model, x, timesteps, context=context, y=y, transformer_options=dict(options))
+
+        def compiled():
+            patch.compiled_unet_forward(diffusion_model, x, timesteps, context=context, y=y, transformer_options=dict(options))
+
+        timed(eager)
+        eager_time = sum(timed(eager) for _ in range(repeat)) / repeat
+        compile_time = timed(compiled)
+        compiled_time = sum(timed(compiled) for _ in range(repeat)) / repeat
+
+        print(f'{batch}x4x{height}x{width}: eager {eager_time * 1000:.1f} ms/step, '
+              f'first compiled step {compile_time:.1f} s, '
+              f'compiled {compiled_time * 1000:.1f} ms/step ({eager_time / compiled_time:.2f}x)')
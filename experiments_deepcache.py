@@ -0,0 +1,45 @@
+import modules.patch
+
+from experiments_common import encode, diffuse, compare
+
+
+configs = [
+    # (deep_cache_interval, deep_cache_depth), interval 1 is the baseline
+    (1, 1),
+    (2, 1),
+    (2, 3),
+    (3, 1),
+    (3, 3),
+    (5, 1),
+]
+
+performances = [
+    # (performance, steps)
+    ('Speed', 30),
+    ('Quality', 60),
+]
+
+width, height = 1024, 1024
+seeds = [12345, 23456]
+
+conds = encode('a photo of an old bookshop interior, warm light, detailed shelves')
+
+
+def run(config, steps, seed):
+    modules.patch.deep_cache_interval, modules.patch.deep_cache_depth = config
+    return diffuse(conds, steps, width, height, seed)
+
+
+run(configs[0], performances[0][1], seeds[0])  # warm up
+
+print('| performance | interval | depth | time (s) | speedup | PSNR (dB) | SSIM |')
+print('|---|---|---|---|---|---|---|')
+for performance, steps in performances:
+    baselines, base_time = {}, None
+    for config in configs:
+        elapsed, psnr, ssim = compare(lambda seed: run(config, steps, seed), seeds, baselines)
+        base_time = base_time or elapsed
+        print(f'| {performance} | {config[0]} | {config[1]} | {elapsed:.2f} | {base_time / elapsed:.2f}x '
+              f'| {psnr:.2f} | {ssim:.4f} |')
+
+modules.patch.deep_cache_interval, modules.patch.deep_cache_depth = 1, 1
@@ -1,4 +1,5 @@
-from modules.expansion import FooocusExpansion
+import time
+from extras.expansion import FooocusExpansion
 
 expansion = FooocusExpansion()
 
@@ -6,3 +7,31 @@ text = 'a handsome man'
 
 for i in range(64):
     print(expansion(text, seed=i))
+
+seeds = list(range(1000, 1008))
+
+expansion.cache = {}
+t = time.perf_counter()
+sequential = [expansion(text, seed=s) for s in seeds]
+print(f'Sequential: {time.perf_counter() - t:.2f} seconds')
+
+expansion.cache = {}
+t = time.perf_counter()
+batched = expansion.expand_batch(text, seeds)
+print(f'Batched: {time.perf_counter() - t:.2f} seconds')
+
+t = time.perf_counter()
+cached = expansion.expand_batch(text, seeds)
+print(f'Cached: {time.perf_counter() - t:.2f} seconds')
+
+print(f'Batched results match sequential results: {batched == sequential == cached}')
+
+int8_expansion = FooocusExpansion(backend='cpu-int8')
+
+t = time.perf_counter()
+int8_batched = int8_expansion.expand_batch(text, seeds)
+print(f'Batched (cpu-int8): {time.perf_counter() - t:.2f} seconds')
+
+for a, b in zip(batched, int8_batched):
+    print(f'[default] {a}')
+    print(f'[cpu-int8] {b}')
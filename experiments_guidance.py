@@ -0,0 +1,73 @@
+import numpy as np
+
+import modules.patch
+import modules.default_pipeline as pipeline
+
+from experiments_common import encode, diffuse, psnr
+
+
+schedules = [
+    # (cfg_skip_after, cfg_reuse_interval, sharpness_end)
+    (1.0, 1, 1.0),
+    (1.0, 1, 0.5),
+    (0.8, 1, 1.0),
+    (0.6, 1, 1.0),
+    (0.4, 1, 1.0),
+    (1.0, 2, 1.0),
+    (1.0, 3, 1.0),
+    (0.6, 2, 0.5),
+]
+
+steps = 30
+width, height = 1024, 1024
+seeds = [12345, 23456, 34567]
+
+conds = encode('a photo of a lighthouse on a cliff at sunset, detailed, dramatic clouds')
+
+unet_rows = [0]
+
+
+def count_rows(unet):
+    if unet is None:
+        return
+    apply_model = unet.model.apply_model
+
+    def counted_apply_model(x, t, **kwargs):
+        unet_rows[0] += int(x.shape[0])
+        return apply_model(x, t, **kwargs)
+
+    unet.model.apply_model = counted_apply_model
+
+
+count_rows(pipeline.final_unet)
+count_rows(pipeline.final_refiner_unet)
+
+
+def run(schedule, seed):
+    modules.patch.cfg_skip_after, modules.patch.cfg_reuse_interval, modules.patch.sharpness_end = schedule
+    unet_rows[0] = 0
+    image, seconds = diffuse(conds, steps, width, height, seed)
+    return image, seconds, unet_rows[0]
+
+
+run(schedules[0], seeds[0])  # warm up
+
+baselines = {}
+rows = []
+for schedule in schedules:
+    elapsed, evaluations, scores = 0.0, 0, []
+    for seed in seeds:
+        image, seconds, count = run(schedule, seed)
+        if schedule == schedules[0]:
+            baselines[seed] = image
+        elapsed += seconds
+        evaluations += count
+        scores.append(psnr(baselines[seed], image))
+    rows.append((schedule, elapsed / len(seeds), evaluations / len(seeds), float(np.mean(scores))))
+
+base_time, base_evaluations = rows[0][1], rows[0][2]
+print('| skip after | reuse every | sharpness end | time (s) | UNet rows | rows saved | PSNR vs default (dB) |')
+print('|---|---|---|---|---|---|---|')
+for (skip_after, reuse, sharpness_end), seconds, evaluations, score in rows:
+    print(f'| {skip_after} | {reuse} | {sharpness_end} | {seconds:.2f} ({seconds / base_time * 100:.0f}%) '
+          f'| {evaluations:.0f} | {(1 - evaluations / base_evaluations) * 100:.0f}% | {score:.2f} |')
@@ -0,0 +1,59 @@
+import time
+import numpy as np
+
+import modules.core as core
+import modules.upscaler as upscaler
+import modules.default_pipeline as pipeline
+
+from modules.util import resample_image, get_shape_ceil, get_size_for_shape_ceil
+from experiments_common import encode, diffuse, psnr
+
+
+steps = 18
+seed = 12345
+
+conds = encode('a photo of a harbour town at dusk, boats, detailed houses, warm window lights')
+
+
+def upscale_diffuse(latent, width, height, denoise):
+    return diffuse(conds, steps, width, height, seed, latent=latent, denoise=denoise)[0]
+
+
+def pixel_upscale(img, f):
+    t = time.perf_counter()
+    H, W, C = img.shape
+    img = resample_image(upscaler.perform_upscale(img), width=W * f, height=H * f)
+    latent = core.encode_vae(vae=pipeline.final_vae, pixels=core.numpy_to_pytorch(img), tiled=True)
+    prepare = time.perf_counter() - t
+    B, C, H, W = latent['samples'].shape
+    return upscale_diffuse(latent, W * 8, H * 8, 0.382), prepare, time.perf_counter() - t
+
+
+def latent_upscale(img, f, method):
+    t = time.perf_counter()
+    H, W, C = img.shape
+    height, width = get_size_for_shape_ceil(H, W, max(get_shape_ceil(H * f, W * f), 1024))
+    latent = core.encode_vae(vae=pipeline.final_vae, pixels=core.numpy_to_pytorch(img))
+    latent = core.upscale_latent(latent, width=width, height=height, method=method)
+    prepare = time.perf_counter() - t
+    return upscale_diffuse(latent, width, height, 0.5), prepare, time.perf_counter() - t
+
+
+def detail(a):
+    # Variance of the Laplacian of the luminance, higher is sharper.
+    y = a.astype(np.float64).mean(axis=2)
+    return float(np.var(y[1:-1, 1:-1] * 4 - y[:-2, 1:-1] - y[2:, 1:-1] - y[1:-1, :-2] - y[1:-1, 2:]))
+
+
+source = upscale_diffuse(None, 1024, 1024, 1.0)
+
+print('| factor | path | prepare (s) | total (s) | PSNR vs Lanczos (dB) | detail |')
+print('|---|---|---|---|---|---|')
+for f in [1.5, 2.0]:
+    paths = [('ESRGAN + tiled encode', lambda: pixel_upscale(source, f))]
+    paths += [(f'latent {method}', lambda method=method: latent_upscale(source, f, method))
+              for method in ['bislerp', 'bicubic', 'nearest-exact']]
+    for name, fn in paths:
+        image, prepare, total = fn()
+        reference = resample_image(source, width=image.shape[1], height=image.shape[0])
+        print(f'| {f}x | {name} | {prepare:.2f} | {total:.2f} | {psnr(reference, image):.2f} | {detail(image):.1f} |')
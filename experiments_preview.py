@@ -0,0 +1,46 @@
+import os
+import time
+import torch
+
+import modules.core as core
+import modules.config
+import modules.default_pipeline as pipeline
+import ldm_patched.modules.sd
+import ldm_patched.modules.latent_formats
+
+from ldm_patched.taesd.taesd import TAESD
+
+
+torch.set_grad_enabled(False)
+device = torch.device('cpu')
+repeat = 3
+
+vae_approx = core.VAEApprox()
+vae_approx.load_state_dict(torch.load(os.path.join(modules.config.path_vae_approx, 'xlvaeapp.pth'), map_location='cpu'))
+vae_approx.eval()
+
+taesd = TAESD(decoder_path=modules.config.downloading_taesd_decoder(is_sdxl=True)).eval()
+latent_rgb_factors = torch.tensor(ldm_patched.modules.latent_formats.SDXL().latent_rgb_factors)
+vae = ldm_patched.modules.sd.VAE(sd=pipeline.final_vae.get_sd(), device=device, dtype=torch.float32)
+
+backends = [
+    ('Latent RGB', lambda x: torch.einsum('bchw,cr->brhw', x, latent_rgb_factors)),
+    ('VAE Approx', lambda x: vae_approx(x)),
+    ('TAESD', lambda x: taesd.decode(x)),
+    ('VAE', lambda x: vae.first_stage_model.decode(x)),
+]
+
+print('| backend | 1024x1024 (ms) | 1152x896 (ms) | 1536x1536 (ms) | ms per megapixel |')
+print('|---|---|---|---|---|')
+for name, fn in backends:
+    row, per_megapixel = [], []
+    for height, width in [(128, 128), (112, 144), (192, 192)]:
+        x = torch.randn(1, 4, height, width)
+        fn(x)  # warm up
+        t = time.perf_counter()
+        for _ in range(repeat):
+            fn(x)
+        ms = (time.perf_counter() - t) / repeat * 1000.0
+        row.append(f'{ms:.0f}')
+        per_megapixel.append(ms / (height * width * 64 / 1e6))
+    print(f'| {name} | {" | ".join(row)} | {sum(per_megapixel) / len(per_megapixel):.0f} |')
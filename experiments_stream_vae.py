@@ -0,0 +1,42 @@
+import time
+import torch
+import numpy as np
+
+import modules.core as core
+import modules.default_pipeline as pipeline
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+
+
+def peak_memory():
+    return torch.cuda.max_memory_allocated() / 1024 ** 2 if torch.cuda.is_available() else float('nan')
+
+
+vae = pipeline.final_vae
+
+# SDXL latents: 2048x2048 -> 256x256, 2816x2816 -> 352x352
+for height, width in [(256, 256), (256, 352), (352, 352)]:
+    torch.manual_seed(0)
+    latent = {'samples': torch.randn(1, 4, height, width)}
+
+    synchronize()
+    t = time.perf_counter()
+    full = core.pytorch_to_numpy(core.decode_vae(vae=vae, latent_image=latent))[0]
+    full_time, full_memory = time.perf_counter() - t, peak_memory()
+
+    synchronize()
+    t = time.perf_counter()
+    first_rows, streamed = None, []
+    for index, y, rows in core.decode_vae_stream(vae=vae, latent_image=latent):
+        first_rows = first_rows or time.perf_counter() - t
+        streamed.append(rows)
+    stream_time, stream_memory = time.perf_counter() - t, peak_memory()
+
+    diff = np.abs(full.astype(np.float64) - np.concatenate(streamed).astype(np.float64)).mean()
+    print(f'{height * 8}x{width * 8}: full {full_time:.2f} s / {full_memory:.0f} MB, '
+          f'streamed first rows {first_rows:.2f} s, total {stream_time:.2f} s / {stream_memory:.0f} MB, '
+          f'mean abs diff {diff:.2f}')
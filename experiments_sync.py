@@ -0,0 +1,53 @@
+import os
+import warnings
+import torch
+
+import modules.core as core
+import modules.advanced_parameters as advanced_parameters
+import modules.default_pipeline as pipeline
+
+from collections import Counter
+
+
+assert torch.cuda.is_available(), 'Counting device syncs needs a CUDA device.'
+
+hot_paths = [os.path.abspath(p) for p in ['modules/patch.py', 'extras/ip_adapter.py', 'ldm_patched/ldm/modules']]
+
+advanced_parameters.disable_preview = True
+positive = pipeline.clip_encode(['a photo of a cat sitting on a wooden table'])
+negative = pipeline.clip_encode([''])
+latent = core.generate_empty_latent(width=1024, height=1024, batch_size=1)
+
+steps = 10
+syncs_per_step = []
+
+with warnings.catch_warnings(record=True) as records:
+    warnings.simplefilter('always')
+
+    def callback(step, x0, x, total_steps, y):
+        syncs_per_step.append(Counter((r.filename, r.lineno) for r in records))
+        records.clear()
+
+    torch.cuda.set_sync_debug_mode('warn')
+    try:
+        core.ksampler(model=pipeline.final_unet, positive=positive, negative=negative, latent=latent,
+                      seed=12345, steps=steps, cfg=7.0, callback_function=callback)
+    finally:
+        torch.cuda.set_sync_debug_mode('default')
+
+# The first step also includes loading the model and preparing the conds.
+for step, syncs in enumerate(syncs_per_step[1:], start=1):
+    hot = sum(n for (filename, _), n in syncs.items() if any(filename.startswith(p) for p in hot_paths))
+    print(f'Step {step}: {sum(syncs.values())} syncs, {hot} in the UNet / guidance hot path')
+
+hot_total = Counter()
+for syncs in syncs_per_step[1:]:
+    for (filename, lineno), n in syncs.items():
+        if any(filename.startswith(p) for p in hot_paths):
+            hot_total[f'{os.path.relpath(filename)}:{lineno}'] += n
+
+for location, n in hot_total.most_common():
+    print(f'{location}: {n}')
+
+assert len(hot_total) == 0, 'The hot path still synchronizes with the device.'
+print('No device syncs in the hot path.')
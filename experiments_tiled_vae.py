@@ -0,0 +1,47 @@
+import time
+import torch
+
+import ldm_patched.modules.utils as utils
+import ldm_patched.modules.model_management as model_management
+import modules.default_pipeline as pipeline
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def timed(fn):
+    synchronize()
+    t = time.perf_counter()
+    result = fn()
+    synchronize()
+    return result, time.perf_counter() - t
+
+
+def decode_tiled_legacy(vae, samples, tile_x=64, tile_y=64, overlap=16):
+    decode_fn = lambda a: (vae.first_stage_model.decode(a.to(vae.vae_dtype).to(vae.device)) + 1.0).float()
+    output = sum(utils.tiled_scale(samples, decode_fn, tx, ty, overlap, upscale_amount=vae.downscale_ratio,
+                                   output_device=vae.output_device)
+                 for tx, ty in [(tile_x // 2, tile_y * 2), (tile_x * 2, tile_y // 2), (tile_x, tile_y)])
+    return torch.clamp(output / 3.0 / 2.0, min=0.0, max=1.0)
+
+
+vae = pipeline.final_vae
+model_management.load_model_gpu(vae.patcher)
+
+# SDXL latents: 1024x1024 -> 128x128, 2048x2048 -> 256x256, 3072x2048 -> 384x256
+for height, width in [(128, 128), (256, 256), (256, 384)]:
+    torch.manual_seed(0)
+    samples = torch.randn(1, 4, height, width)
+
+    with torch.inference_mode():
+        reference, full_time = timed(lambda: vae.decode(samples).movedim(-1, 1))
+        legacy, legacy_time = timed(lambda: decode_tiled_legacy(vae, samples))
+        current, current_time = timed(lambda: vae.decode_tiled_(samples))
+
+    legacy_diff = (legacy - reference).abs().mean().item() * 255.0
+    current_diff = (current - reference).abs().mean().item() * 255.0
+    print(f'{height * 8}x{width * 8}: full {full_time:.2f} s, '
+          f'triple tiled {legacy_time:.2f} s (mean abs diff {legacy_diff:.2f}), '
+          f'single tiled {current_time:.2f} s (mean abs diff {current_diff:.2f}, {legacy_time / current_time:.2f}x)')
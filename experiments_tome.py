@@ -0,0 +1,51 @@
+import modules.core as core
+import modules.default_pipeline as pipeline
+
+from experiments_common import encode, diffuse, compare
+
+
+configs = [
+    # (name, tome_ratio, hypertile_tile_size or None)
+    ('baseline', 0.0, None),
+    ('ToMe 0.3', 0.3, None),
+    ('ToMe 0.5', 0.5, None),
+    ('HyperTile 256', 0.0, 256),
+]
+
+resolutions = [(1024, 1024), (1536, 1536)]
+steps = 30
+seeds = [12345, 23456]
+
+conds = encode('a photo of a red fox in a snowy forest, detailed fur, soft morning light')
+
+base_unet = pipeline.final_unet
+base_refiner_unet = pipeline.final_refiner_unet
+
+
+def apply(tome_ratio, tile_size):
+    pipeline.final_unet, pipeline.final_refiner_unet = base_unet, base_refiner_unet
+    if tome_ratio > 0:
+        pipeline.final_unet = core.apply_tome(pipeline.final_unet, tome_ratio)
+        if pipeline.final_refiner_unet is not None:
+            pipeline.final_refiner_unet = core.apply_tome(pipeline.final_refiner_unet, tome_ratio)
+    if tile_size is not None:
+        pipeline.final_unet = core.apply_hypertile(pipeline.final_unet, tile_size, 0)
+        if pipeline.final_refiner_unet is not None:
+            pipeline.final_refiner_unet = core.apply_hypertile(pipeline.final_refiner_unet, tile_size, 0)
+
+
+print('| resolution | configuration | time (s) | speedup | PSNR (dB) | SSIM |')
+print('|---|---|---|---|---|---|')
+for width, height in resolutions:
+    apply(0.0, None)
+    diffuse(conds, steps, width, height, seeds[0])  # warm up
+
+    baselines, base_time = {}, None
+    for name, tome_ratio, tile_size in configs:
+        apply(tome_ratio, tile_size)
+        elapsed, psnr, ssim = compare(lambda seed: diffuse(conds, steps, width, height, seed), seeds, baselines)
+        base_time = base_time or elapsed
+        print(f'| {width}x{height} | {name} | {elapsed:.2f} | {base_time / elapsed:.2f}x '
+              f'| {psnr:.2f} | {ssim:.4f} |')
+
+apply(0.0, None)
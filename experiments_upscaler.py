@@ -0,0 +1,38 @@
+# Run with --always-cpu to measure the CPU path.
+import copy
+import time
+import numpy as np
+
+import modules.core as core
+import modules.upscaler as upscaler
+
+from modules.util import resample_image
+from ldm_patched.contrib.external_upscale_model import ImageUpscaleWithModel
+
+
+def upscale_legacy(img):
+    img = ImageUpscaleWithModel().upscale(legacy_network, core.numpy_to_pytorch(img))[0]
+    return core.pytorch_to_numpy(img)[0]
+
+
+# The legacy node moves its model back to the CPU, so it gets its own copy.
+legacy_network = copy.deepcopy(upscaler.load_upscaler().model).cpu()
+rng = np.random.default_rng(0)
+
+for size in [1024, 2048]:
+    # Smooth content, closer to a generated image than white noise.
+    img = resample_image(rng.integers(0, 256, (size // 16, size // 16, 3), dtype=np.uint8), size, size)
+
+    upscaler.perform_upscale(img[:256, :256])  # warm up
+
+    t = time.perf_counter()
+    legacy = resample_image(upscale_legacy(img), size * 2, size * 2)
+    legacy_time = time.perf_counter() - t
+
+    t = time.perf_counter()
+    current = resample_image(upscaler.perform_upscale(img), size * 2, size * 2)
+    current_time = time.perf_counter() - t
+
+    diff = np.abs(legacy.astype(np.float64) - current.astype(np.float64)).mean()
+    print(f'{size} -> {size * 2} on {upscaler.model.load_device}: legacy {legacy_time:.1f} s, '
+          f'resident batched {current_time:.1f} s ({legacy_time / current_time:.2f}x), mean abs diff {diff:.2f}')
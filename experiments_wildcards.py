@@ -0,0 +1,60 @@
+import os
+import re
+import random
+import tempfile
+import time
+
+from modules.sdxl_styles import apply_wildcards, refresh_wildcards
+
+
+def apply_wildcards_legacy(wildcard_text, rng, directory):
+    for _ in range(64):
+        placeholders = re.findall(r'__([\w-]+)__', wildcard_text)
+        if len(placeholders) == 0:
+            return wildcard_text
+
+        for placeholder in placeholders:
+            try:
+                words = open(os.path.join(directory, f'{placeholder}.txt'), encoding='utf-8').read().splitlines()
+                words = [x for x in words if x != '']
+                assert len(words) > 0
+                wildcard_text = wildcard_text.replace(f'__{placeholder}__', rng.choice(words), 1)
+            except:
+                wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
+
+    return wildcard_text
+
+
+with tempfile.TemporaryDirectory() as directory:
+    for i in range(256):
+        with open(os.path.join(directory, f'set{i}.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(f'word{i}-{j}' for j in range(4096)))
+
+    for i in range(16):
+        with open(os.path.join(directory, f'nested{i}.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(f'__set{(i + j) % 256}__ and __set{(i * j) % 256}__' for j in range(64)))
+
+    with open(os.path.join(directory, 'nested_with_underscores.txt'), 'w', encoding='utf-8') as f:
+        f.write('__nested1__ __set0__\n__set1__ or __missing__')
+
+    prompts = [
+        'a photo of __set1__, __set2__, __set3__ and __set4__',
+        ', '.join(f'__nested{i % 16}__' for i in range(32)),
+        '__nested_with_underscores__, __nested3__, __set7__, __missing__, __set7__',
+    ]
+
+    refresh_wildcards(directory)
+
+    for prompt in prompts:
+        seeds = list(range(200))
+
+        t = time.perf_counter()
+        legacy = [apply_wildcards_legacy(prompt, random.Random(seed), directory) for seed in seeds]
+        legacy_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        indexed = [apply_wildcards(prompt, random.Random(seed), directory) for seed in seeds]
+        indexed_time = time.perf_counter() - t
+
+        print(f'{prompt[:48]} ... legacy: {legacy_time:.3f}s, indexed: {indexed_time:.3f}s, '
+              f'identical: {legacy == indexed}')
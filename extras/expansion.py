@@ -8,10 +8,11 @@
 import os
 import torch
 import math
+import args_manager
 import ldm_patched.modules.model_management as model_management
 
-from transformers.generation.logits_process import LogitsProcessorList
-from transformers import AutoTokenizer, AutoModelForCausalLM, set_seed
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.pytorch_utils import Conv1D
 from modules.config import path_fooocus_expansion
 from ldm_patched.modules.model_patcher import ModelPatcher
 
@@ -19,6 +20,8 @@ from ldm_patched.modules.model_patcher import ModelPatcher
 # limitation of np.random.seed(), called from transformers.set_seed()
 SEED_LIMIT_NUMPY = 2**32
 neg_inf = - 8192.0
+top_k = 100
+cache_limit = 4096
 
 
 def safe_str(x):
@@ -34,8 +37,26 @@ def remove_pattern(x, pattern):
     return x
 
 
+def conv1d_to_linear(model):
+    # GPT2 uses transformers Conv1D (a transposed Linear), which dynamic quantization does not recognize.
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, name, linear)
+    return model
+
+
 class FooocusExpansion:
-    def __init__(self):
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = args_manager.args.expansion_backend
+
+        assert backend in ['default', 'cpu-int8']
+        self.backend = backend
+
         self.tokenizer = AutoTokenizer.from_pretrained(path_fooocus_expansion)
 
         positive_words = open(os.path.join(path_fooocus_expansion, 'positive.txt'),
@@ -61,6 +82,16 @@ class FooocusExpansion:
 
         self.model = AutoModelForCausalLM.from_pretrained(path_fooocus_expansion)
         self.model.eval()
+        self.cache = {}
+
+        if self.backend == 'cpu-int8':
+            # Kept out of model management so that it never takes GPU memory and is never reloaded between tasks.
+            self.model = torch.ao.quantization.quantize_dynamic(
+                conv1d_to_linear(self.model), {torch.nn.Linear}, dtype=torch.qint8)
+            self.load_device = torch.device('cpu')
+            self.patcher = None
+            print('Fooocus Expansion engine loaded for cpu, use_int8 = True.')
+            return
 
         load_device = model_management.text_encoder_device()
         offload_device = model_management.text_encoder_offload_device()
@@ -75,52 +106,102 @@ class FooocusExpansion:
         if use_fp16:
             self.model.half()
 
+        self.load_device = load_device
         self.patcher = ModelPatcher(self.model, load_device=load_device, offload_device=offload_device)
         print(f'Fooocus Expansion engine loaded for {load_device}, use_fp16 = {use_fp16}.')
 
     @torch.no_grad()
     @torch.inference_mode()
     def logits_processor(self, input_ids, scores):
-        assert scores.ndim == 2 and scores.shape[0] == 1
+        assert scores.ndim == 2 and scores.shape[0] == input_ids.shape[0]
         self.logits_bias = self.logits_bias.to(scores)
 
-        bias = self.logits_bias.clone()
-        bias[0, input_ids[0].to(bias.device).long()] = neg_inf
-        bias[0, 11] = 0
+        bias = self.logits_bias.repeat(scores.shape[0], 1)
+        bias.scatter_(1, input_ids.to(bias.device).long(), neg_inf)
+        bias[:, 11] = 0
 
         return scores + bias
 
+    @torch.no_grad()
+    @torch.inference_mode()
+    def sample(self, scores, generators):
+        # Same as the top-k multinomial sampling of transformers, but each row draws from its own seeded generator,
+        # so that one batched generation gives exactly the results of generating every seed alone.
+        top_k_threshold = torch.topk(scores, min(top_k, scores.shape[-1]))[0][..., -1, None]
+        scores = scores.masked_fill(scores < top_k_threshold, -float('inf'))
+        probs = torch.nn.functional.softmax(scores, dim=-1)
+
+        return torch.cat([
+            torch.multinomial(probs[i:i + 1].to(g.device), num_samples=1, generator=g).to(probs.device)
+            for i, g in enumerate(generators)], dim=0)
+
     @torch.no_grad()
     @torch.inference_mode()
     def __call__(self, prompt, seed):
+        return self.expand_batch(prompt, [seed])[0]
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def expand_batch(self, prompt, seeds):
         if prompt == '':
-            return ''
+            return ['' for _ in seeds]
+
+        prompt = safe_str(prompt) + ','
+        seeds = [int(seed) % SEED_LIMIT_NUMPY for seed in seeds]
+
+        missing_seeds = []
+        for seed in seeds:
+            if (prompt, seed) not in self.cache and seed not in missing_seeds:
+                missing_seeds.append(seed)
+
+        if len(missing_seeds) > 0:
+            for seed, result in zip(missing_seeds, self.generate(prompt, missing_seeds)):
+                if len(self.cache) >= cache_limit:
+                    self.cache.pop(next(iter(self.cache)))
+                self.cache[(prompt, seed)] = result
 
-        if self.patcher.current_device != self.patcher.load_device:
+        return [self.cache[(prompt, seed)] for seed in seeds]
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def generate(self, prompt, seeds):
+        if self.patcher is not None and self.patcher.current_device != self.patcher.load_device:
             print('Fooocus Expansion loaded by itself.')
             model_management.load_model_gpu(self.patcher)
 
-        seed = int(seed) % SEED_LIMIT_NUMPY
-        set_seed(seed)
-        prompt = safe_str(prompt) + ','
+        generator_device = self.load_device
+        if generator_device.type not in ['cpu', 'cuda']:
+            generator_device = torch.device('cpu')
+
+        generators = [torch.Generator(device=generator_device).manual_seed(seed) for seed in seeds]
 
-        tokenized_kwargs = self.tokenizer(prompt, return_tensors="pt")
-        tokenized_kwargs.data['input_ids'] = tokenized_kwargs.data['input_ids'].to(self.patcher.load_device)
-        tokenized_kwargs.data['attention_mask'] = tokenized_kwargs.data['attention_mask'].to(self.patcher.load_device)
+        input_ids = self.tokenizer(prompt, return_tensors="pt")['input_ids'].to(self.load_device)
 
-        current_token_length = int(tokenized_kwargs.data['input_ids'].shape[1])
+        current_token_length = int(input_ids.shape[1])
         max_token_length = 75 * int(math.ceil(float(current_token_length) / 75.0))
         max_new_tokens = max_token_length - current_token_length
 
         # https://huggingface.co/blog/introducing-csearch
         # https://huggingface.co/docs/transformers/generation_strategies
-        features = self.model.generate(**tokenized_kwargs,
-                                       top_k=100,
-                                       max_new_tokens=max_new_tokens,
-                                       do_sample=True,
-                                       logits_processor=LogitsProcessorList([self.logits_processor]))
-
-        response = self.tokenizer.batch_decode(features, skip_special_tokens=True)
-        result = safe_str(response[0])
+        # All seeds share the prompt, so its kv cache is computed once and broadcast to every row.
+        outputs = self.model(input_ids=input_ids, use_cache=True)
+        past_key_values = tuple(tuple(t.expand(len(seeds), -1, -1, -1) for t in layer)
+                                for layer in outputs.past_key_values)
+        logits = outputs.logits[:, -1, :].expand(len(seeds), -1)
+        input_ids = input_ids.repeat(len(seeds), 1)
+
+        for i in range(max_new_tokens):
+            next_tokens = self.sample(self.logits_processor(input_ids, logits), generators)
+            input_ids = torch.cat([input_ids, next_tokens], dim=1)
+
+            if i == max_new_tokens - 1:
+                break
+
+            outputs = self.model(input_ids=next_tokens, past_key_values=past_key_values, use_cache=True)
+            past_key_values = outputs.past_key_values
+            logits = outputs.logits[:, -1, :]
+
+        response = self.tokenizer.batch_decode(input_ids, skip_special_tokens=True)
+        result = [safe_str(r) for r in response]
 
         return result
@@ -66,11 +66,9 @@ vae_approx_model = None
 vae_approx_filename = os.path.join(path_vae_approx, 'xl-to-v1_interposer-v3.1.safetensors')
 
 
-def parse(x):
+def load():
     global vae_approx_model
 
-    x_origin = x.clone()
-
     if vae_approx_model is None:
         model = Interposer()
         model.eval()
@@ -86,8 +84,11 @@ def parse(x):
         )
         vae_approx_model.dtype = torch.float16 if fp16 else torch.float32
 
-    ldm_patched.modules.model_management.load_model_gpu(vae_approx_model)
+    return vae_approx_model
 
-    x = x_origin.to(device=vae_approx_model.load_device, dtype=vae_approx_model.dtype)
-    x = vae_approx_model.model(x).to(x_origin)
-    return x
+
+def parse(x):
+    # The result stays on the device of the interposer, the refiner samples from it directly.
+    model = load()
+    ldm_patched.modules.model_management.load_model_gpu(model)
+    return model.model(x.to(device=model.load_device, dtype=model.dtype)).to(x.dtype)
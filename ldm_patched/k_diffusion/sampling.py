@@ -90,8 +90,10 @@ class BatchedBrownianTree:
 
     def __call__(self, t0, t1):
         t0, t1, sign = self.sort(t0, t1)
+        # still one torchsde tree per seed, a vectorized bridge would not reproduce the per-seed streams
         if self.cpu_tree:
-            w = torch.stack([tree(t0.cpu().float(), t1.cpu().float()).to(t0.dtype).to(t0.device) for tree in self.trees]) * (self.sign * sign)
+            q0, q1 = t0.cpu().float(), t1.cpu().float()
+            w = torch.stack([tree(q0, q1) for tree in self.trees]).to(t0.dtype).to(t0.device) * (self.sign * sign)
         else:
             w = torch.stack([tree(t0, t1) for tree in self.trees]) * (self.sign * sign)
 
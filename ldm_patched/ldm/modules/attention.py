@@ -1,4 +1,7 @@
+import os
+import json
 import math
+import time
 import torch
 import torch.nn.functional as F
 from torch import nn, einsum
@@ -347,6 +350,95 @@ else:
 
 optimized_attention_masked = optimized_attention
 
+attention_autotune_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../attention_autotune.json'))
+attention_autotune_cache = None
+#basic attention materializes the full score matrix, it is only benchmarked below this many scores per head
+attention_basic_max_scores = 1024 * 1024
+
+def attention_backends(device, q_len=0, kv_len=0):
+    backends = {"sub_quad": attention_sub_quad, "split": attention_split}
+    if q_len * kv_len <= attention_basic_max_scores:
+        backends["basic"] = attention_basic
+    if model_management.xformers_enabled() and device.type == "cuda":
+        backends["xformers"] = attention_xformers
+    if hasattr(F, "scaled_dot_product_attention"):
+        backends["pytorch"] = attention_pytorch
+    return backends
+
+def attention_device_name(device):
+    if device.type == "cuda":
+        return torch.cuda.get_device_name(device)
+    return device.type
+
+def synchronize_device(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elif device.type == "mps":
+        torch.mps.synchronize()
+
+def benchmark_attention(backends, q, k, v, heads, repeat=3):
+    timings = {}
+    for name, backend in backends.items():
+        try:
+            backend(q, k, v, heads)
+            synchronize_device(q.device)
+            t = time.perf_counter()
+            for _ in range(repeat):
+                backend(q, k, v, heads)
+            synchronize_device(q.device)
+            timings[name] = time.perf_counter() - t
+        except Exception as e:
+            model_management.soft_empty_cache()
+            print(f"[Attention] {name} failed on {tuple(q.shape)}: {e}")
+    if len(timings) == 0:
+        return None
+    return min(timings, key=timings.get)
+
+def attention_autotune(q, k, v, heads, mask=None):
+    global attention_autotune_cache
+
+    if mask is not None:
+        return attention_autotune_fallback(q, k, v, heads, mask)
+
+    if attention_autotune_cache is None:
+        attention_autotune_cache = {}
+        if os.path.exists(attention_autotune_path):
+            try:
+                with open(attention_autotune_path, encoding="utf-8") as f:
+                    attention_autotune_cache = json.load(f)
+            except Exception as e:
+                print(f"[Attention] Failed to load {attention_autotune_path}: {e}")
+
+    backends = attention_backends(q.device, q.shape[1], k.shape[1])
+    key = f"{q.shape[0]},{q.shape[1]},{k.shape[1]},{heads},{q.shape[-1] // heads},{q.dtype},{attention_device_name(q.device)}"
+    name = attention_autotune_cache.get(key, None)
+
+    if name == "default":
+        return attention_autotune_fallback(q, k, v, heads)
+
+    if name not in backends:
+        name = benchmark_attention(backends, q, k, v, heads)
+        if name is None:
+            #not saved, the failures may be transient
+            print(f"[Attention] Every backend failed, using the default one for {key}")
+            attention_autotune_cache[key] = "default"
+            return attention_autotune_fallback(q, k, v, heads)
+        print(f"[Attention] Using {name} for batch, q_len, kv_len, heads, dim_head, dtype, device = {key}")
+        attention_autotune_cache[key] = name
+        try:
+            with open(attention_autotune_path, "wt", encoding="utf-8") as f:
+                json.dump({k: v for k, v in attention_autotune_cache.items() if v != "default"}, f, indent=4)
+        except Exception as e:
+            print(f"[Attention] Failed to save {attention_autotune_path}: {e}")
+
+    return backends[name](q, k, v, heads)
+
+attention_autotune_fallback = optimized_attention
+
+if args.attention_autotune:
+    print("Using autotuned cross attention, benchmarking each new attention shape on first use")
+    optimized_attention = attention_autotune
+
 def optimized_attention_for_device(device, mask=False, small_input=False):
     if small_input:
         if model_management.pytorch_attention_enabled():
@@ -91,6 +91,7 @@ attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--attention-split", action="store_true")
 attn_group.add_argument("--attention-quad", action="store_true")
 attn_group.add_argument("--attention-pytorch", action="store_true")
+attn_group.add_argument("--attention-autotune", action="store_true")
 
 parser.add_argument("--disable-xformers", action="store_true")
 
@@ -557,6 +557,25 @@ def intermediate_device():
     else:
         return torch.device("cpu")
 
+#Requests cluster on a few resolutions, so latent sized buffers are reused across steps and tasks.
+#A buffer stays valid until the same name, shape, dtype and device is requested again.
+#The pool is not counted by the memory management, so it is capped in bytes and only meant for latent sized buffers.
+buffer_pool = {}
+buffer_pool_size = 16
+buffer_pool_max_bytes = 64 * 1024 * 1024
+
+def get_pooled_buffer(name, shape, dtype=torch.float32, device="cpu", pin_memory=False):
+    key = (name, tuple(shape), dtype, str(device))
+    buffer = buffer_pool.pop(key, None)
+    if buffer is None:
+        buffer = torch.empty(shape, dtype=dtype, device=device, pin_memory=pin_memory)
+        if buffer.numel() * buffer.element_size() > buffer_pool_max_bytes:
+            return buffer
+    buffer_pool[key] = buffer
+    while len(buffer_pool) > buffer_pool_size or sum(b.numel() * b.element_size() for b in buffer_pool.values()) > buffer_pool_max_bytes:
+        buffer_pool.pop(next(iter(buffer_pool)))
+    return buffer
+
 def vae_device():
     if args.vae_in_cpu:
         return torch.device("cpu")
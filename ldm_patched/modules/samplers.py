@@ -34,11 +34,14 @@ def get_area_and_mult(conds, x_in, timestep_in):
         assert(mask.shape[2] == x_in.shape[3])
         mask = mask[:,area[2]:area[0] + area[2],area[3]:area[1] + area[3]] * mask_strength
         mask = mask.unsqueeze(1).repeat(input_x.shape[0] // mask.shape[0], input_x.shape[1], 1, 1)
+    elif area == (x_in.shape[2], x_in.shape[3], 0, 0):
+        # Full area without mask, a scalar weight gives the same result as a tensor of ones.
+        mask = None
     else:
         mask = torch.ones_like(input_x)
-    mult = mask * strength
+    mult = strength if mask is None else mask * strength
 
-    if 'mask' not in conds:
+    if 'mask' not in conds and mask is not None:
         rr = 8
         if area[2] != 0:
             for t in range(rr):
@@ -126,13 +129,7 @@ def cond_cat(c_list):
 
     return out
 
-def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
-    out_cond = torch.zeros_like(x_in)
-    out_count = torch.ones_like(x_in) * 1e-37
-
-    out_uncond = torch.zeros_like(x_in)
-    out_uncond_count = torch.ones_like(x_in) * 1e-37
-
+def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options, pooled_outputs=False):
     COND = 0
     UNCOND = 1
 
@@ -151,6 +148,23 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
 
             to_run += [(p, UNCOND)]
 
+    # When every cond covers the full latent with a scalar weight, the outputs are combined
+    # directly instead of being accumulated into full size buffers.
+    full_area = all(not isinstance(p.mult, torch.Tensor) for p, _ in to_run)
+
+    if full_area:
+        out_cond, out_count = None, 1e-37
+        out_uncond, out_uncond_count = None, 1e-37
+    else:
+        out_cond = model_management.get_pooled_buffer("out_cond", x_in.shape, x_in.dtype, x_in.device).zero_()
+        out_count = model_management.get_pooled_buffer("out_count", x_in.shape, x_in.dtype, x_in.device).fill_(1e-37)
+
+        out_uncond = model_management.get_pooled_buffer("out_uncond", x_in.shape, x_in.dtype, x_in.device).zero_()
+        out_uncond_count = model_management.get_pooled_buffer("out_uncond_count", x_in.shape, x_in.dtype, x_in.device).fill_(1e-37)
+
+    # The batching plan only depends on the shapes involved, so it is computed once per sampling run.
+    batch_plan = model_options.get('cond_batch_plan', None)
+
     while len(to_run) > 0:
         first = to_run[0]
         first_shape = first[0][0].shape
@@ -162,13 +176,20 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
         to_batch_temp.reverse()
         to_batch = to_batch_temp[:1]
 
-        free_memory = model_management.get_free_memory(x_in.device)
-        for i in range(1, len(to_batch_temp) + 1):
-            batch_amount = to_batch_temp[:len(to_batch_temp)//i]
-            input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
-            if model.memory_required(input_shape) < free_memory:
-                to_batch = batch_amount
-                break
+        plan_key = (id(model), tuple(first_shape), len(to_batch_temp))
+        if batch_plan is not None and plan_key in batch_plan:
+            to_batch = to_batch_temp[:batch_plan[plan_key]]
+        else:
+            free_memory = model_management.get_free_memory(x_in.device)
+            for i in range(1, len(to_batch_temp) + 1):
+                batch_amount = to_batch_temp[:len(to_batch_temp)//i]
+                input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
+                if model.memory_required(input_shape) < free_memory:
+                    to_batch = batch_amount
+                    break
+
+            if batch_plan is not None:
+                batch_plan[plan_key] = len(to_batch)
 
         input_x = []
         mult = []
@@ -223,7 +244,15 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
         del input_x
 
         for o in range(batch_chunks):
-            if cond_or_uncond[o] == COND:
+            if full_area:
+                weighted = output[o] if mult[o] == 1.0 else output[o] * mult[o]
+                if cond_or_uncond[o] == COND:
+                    out_cond = weighted if out_cond is None else out_cond + weighted
+                    out_count += mult[o]
+                else:
+                    out_uncond = weighted if out_uncond is None else out_uncond + weighted
+                    out_uncond_count += mult[o]
+            elif cond_or_uncond[o] == COND:
                 out_cond[:,:,area[o][2]:area[o][0] + area[o][2],area[o][3]:area[o][1] + area[o][3]] += output[o] * mult[o]
                 out_count[:,:,area[o][2]:area[o][0] + area[o][2],area[o][3]:area[o][1] + area[o][3]] += mult[o]
             else:
@@ -231,9 +260,22 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
                 out_uncond_count[:,:,area[o][2]:area[o][0] + area[o][2],area[o][3]:area[o][1] + area[o][3]] += mult[o]
         del mult
 
-    out_cond /= out_count
+    if full_area:
+        #a single cond of weight 1 is the model output itself, dividing by 1 would only copy it
+        out_cond = torch.zeros_like(x_in) if out_cond is None else (out_cond if out_count == 1.0 else out_cond / out_count).to(x_in.dtype)
+        out_uncond = torch.zeros_like(x_in) if out_uncond is None else (out_uncond if out_uncond_count == 1.0 else out_uncond / out_uncond_count).to(x_in.dtype)
+        return out_cond, out_uncond
+
+    if pooled_outputs:
+        #the caller is done with the results before the next call, so they stay in the pooled accumulators
+        out_cond /= out_count
+        out_uncond /= out_uncond_count
+        return out_cond, out_uncond
+
+    #the samplers may keep the results across steps
+    out_cond = out_cond / out_count
     del out_count
-    out_uncond /= out_uncond_count
+    out_uncond = out_uncond / out_uncond_count
     del out_uncond_count
     return out_cond, out_uncond
 
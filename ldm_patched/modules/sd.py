@@ -1,4 +1,5 @@
 import torch
+import contextlib
 
 from ldm_patched.modules import model_management
 from ldm_patched.ldm.models.autoencoder import AutoencoderKL, AutoencodingEngine
@@ -147,6 +148,42 @@ class CLIP:
     def get_key_patches(self):
         return self.patcher.get_key_patches()
 
+@contextlib.contextmanager
+def frozen_group_norm(model, function, sample, size):
+    # Every GroupNorm takes its statistics from one pass over a downscaled copy of the whole sample,
+    # so that all tiles are normalized the same way and a single tiled pass has no seams.
+    norms = [m for m in model.modules() if isinstance(m, torch.nn.GroupNorm)]
+    statistics = {}
+
+    def record(module):
+        def forward(x):
+            var, mean = torch.var_mean(x.float().reshape(x.shape[0], module.num_groups, -1), dim=-1, correction=0)
+            statistics[module] = (mean[..., None], torch.rsqrt(var[..., None] + module.eps))
+            return type(module).forward(module, x)
+        return forward
+
+    def frozen(module):
+        def forward(x):
+            mean, rstd = statistics[module]
+            h = ((x.float().reshape(x.shape[0], module.num_groups, -1) - mean) * rstd).reshape(x.shape).to(x.dtype)
+            return h * module.weight.to(x).view(1, -1, 1, 1) + module.bias.to(x).view(1, -1, 1, 1)
+        return forward
+
+    scale = size / max(sample.shape[2], sample.shape[3])
+    try:
+        if len(norms) > 0 and scale < 1.0:
+            for m in norms:
+                m.forward = record(m)
+            with torch.inference_mode():
+                # Nearest keeps the value distribution of the sample, which is what the statistics depend on.
+                function(torch.nn.functional.interpolate(sample, scale_factor=scale, mode='nearest-exact'))
+            for m in norms:
+                m.forward = frozen(m)
+        yield
+    finally:
+        for m in norms:
+            m.__dict__.pop('forward', None)
+
 class VAE:
     def __init__(self, sd=None, device=None, config=None, dtype=None):
         if 'decoder.up_blocks.0.resnets.0.norm1.weight' in sd.keys(): #diffusers format
@@ -202,30 +239,25 @@ class VAE:
 
     def decode_tiled_(self, samples, tile_x=64, tile_y=64, overlap = 16):
         steps = samples.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x, tile_y, overlap)
-        steps += samples.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x // 2, tile_y * 2, overlap)
-        steps += samples.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x * 2, tile_y // 2, overlap)
         pbar = ldm_patched.modules.utils.ProgressBar(steps)
 
         decode_fn = lambda a: (self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)) + 1.0).float()
-        output = torch.clamp((
-            (ldm_patched.modules.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.downscale_ratio, output_device=self.output_device, pbar = pbar) +
-            ldm_patched.modules.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.downscale_ratio, output_device=self.output_device, pbar = pbar) +
-             ldm_patched.modules.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.downscale_ratio, output_device=self.output_device, pbar = pbar))
-            / 3.0) / 2.0, min=0.0, max=1.0)
-        return output
+        output = []
+        for b in range(samples.shape[0]):
+            with frozen_group_norm(self.first_stage_model, decode_fn, samples[b:b+1], max(tile_x, tile_y)):
+                output.append(ldm_patched.modules.utils.tiled_scale(samples[b:b+1], decode_fn, tile_x, tile_y, overlap, upscale_amount = self.downscale_ratio, output_device=self.output_device, pbar = pbar))
+        return torch.clamp(torch.cat(output) / 2.0, min=0.0, max=1.0)
 
     def encode_tiled_(self, pixel_samples, tile_x=512, tile_y=512, overlap = 64):
         steps = pixel_samples.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x, tile_y, overlap)
-        steps += pixel_samples.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x // 2, tile_y * 2, overlap)
-        steps += pixel_samples.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x * 2, tile_y // 2, overlap)
         pbar = ldm_patched.modules.utils.ProgressBar(steps)
 
         encode_fn = lambda a: self.first_stage_model.encode((2. * a - 1.).to(self.vae_dtype).to(self.device)).float()
-        samples = ldm_patched.modules.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += ldm_patched.modules.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += ldm_patched.modules.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples /= 3.0
-        return samples
+        samples = []
+        for b in range(pixel_samples.shape[0]):
+            with frozen_group_norm(self.first_stage_model, encode_fn, pixel_samples[b:b+1], max(tile_x, tile_y)):
+                samples.append(ldm_patched.modules.utils.tiled_scale(pixel_samples[b:b+1], encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar))
+        return torch.cat(samples)
 
     def decode(self, samples_in):
         try:
@@ -251,6 +283,32 @@ class VAE:
         output = self.decode_tiled_(samples, tile_x, tile_y, overlap)
         return output.movedim(1,-1)
 
+    def decode_stream(self, samples_in, band=32, overlap=8):
+        # Yields (index, first row, uint8 rows) band by band, so the full float image is never held.
+        # Each band is decoded with `overlap` latent rows of context and blended into the previous band.
+        memory_used = self.memory_used_decode((1, samples_in.shape[1], band + 2 * overlap, samples_in.shape[3]), self.vae_dtype)
+        model_management.load_models_gpu([self.patcher], memory_required=memory_used)
+        decode_fn = lambda a: (self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float() + 1.0) / 2.0
+        r = self.downscale_ratio
+        height = samples_in.shape[2]
+
+        with torch.inference_mode():
+            for b in range(samples_in.shape[0]):
+                sample = samples_in[b:b+1]
+                previous = None
+                with frozen_group_norm(self.first_stage_model, decode_fn, sample, max(band + 2 * overlap, 64)):
+                    for y in range(0, height, band):
+                        top, end, bottom = max(y - overlap, 0), min(y + band, height), min(y + band + overlap, height)
+                        pixels = decode_fn(sample[:, :, top:bottom])[0]
+                        rows = pixels[:, (y - top) * r:(end - top) * r]
+                        if previous is not None:
+                            n = min(previous.shape[1], rows.shape[1])
+                            w = ((torch.arange(n, device=rows.device, dtype=rows.dtype) + 0.5) / n).view(1, -1, 1)
+                            rows[:, :n] = previous[:, :n] * (1.0 - w) + rows[:, :n] * w
+                        previous = pixels[:, (end - top) * r:]
+                        rows = torch.clamp(rows * 255.0, min=0.0, max=255.0).to(torch.uint8).movedim(0, -1)
+                        yield b, y * r, rows.to(self.output_device).cpu().numpy()
+
     def encode(self, pixel_samples):
         pixel_samples = pixel_samples.movedim(-1,1)
         try:
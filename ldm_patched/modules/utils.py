@@ -404,31 +404,43 @@ def common_upscale(samples, width, height, upscale_method, crop):
 def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     return math.ceil((height / (tile_y - overlap))) * math.ceil((width / (tile_x - overlap)))
 
+tiled_scale_windows = {}
+
+def get_tiled_scale_window(height, width, feather, device):
+    key = (height, width, feather, str(device))
+    window = tiled_scale_windows.get(key, None)
+    if window is None:
+        def ramp(length):
+            w = torch.ones(length)
+            m = min(feather, length)
+            w[:m] = torch.arange(1, m + 1, dtype=torch.float32) / feather
+            return w * w.flip(0)
+        window = (ramp(height)[:, None] * ramp(width)[None, :]).to(device)[None, None]
+        tiled_scale_windows[key] = window
+    return window
+
 @torch.inference_mode()
 def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
-    output = torch.empty((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
+    output = torch.zeros((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
+    out_div = torch.zeros((1, 1, output.shape[2], output.shape[3]), device=output_device)
+    feather = round(overlap * upscale_amount)
     for b in range(samples.shape[0]):
         s = samples[b:b+1]
-        out = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
-        out_div = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+        out = output[b:b+1]
+        out_div.zero_()
         for y in range(0, s.shape[2], tile_y - overlap):
             for x in range(0, s.shape[3], tile_x - overlap):
                 s_in = s[:,:,y:y+tile_y,x:x+tile_x]
 
                 ps = function(s_in).to(output_device)
-                mask = torch.ones_like(ps)
-                feather = round(overlap * upscale_amount)
-                for t in range(feather):
-                        mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
-                out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps * mask
-                out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
+                mask = get_tiled_scale_window(ps.shape[2], ps.shape[3], feather, output_device)
+                out_y, out_x = round(y*upscale_amount), round(x*upscale_amount)
+                out[:,:,out_y:out_y+ps.shape[2],out_x:out_x+ps.shape[3]] += ps * mask
+                out_div[:,:,out_y:out_y+ps.shape[2],out_x:out_x+ps.shape[3]] += mask
                 if pbar is not None:
                     pbar.update(1)
 
-        output[b:b+1] = out/out_div
+        out /= out_div
     return output
 
 PROGRESS_BAR_ENABLED = True
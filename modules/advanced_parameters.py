@@ -6,7 +6,10 @@ disable_preview, adm_scaler_positive, adm_scaler_negative, adm_scaler_end, adapt
     refiner_swap_method, \
     freeu_enabled, freeu_b1, freeu_b2, freeu_s1, freeu_s2, \
     debugging_inpaint_preprocessor, inpaint_disable_initial_latent, inpaint_engine, inpaint_strength, inpaint_respective_field, \
-    inpaint_mask_upload_checkbox, invert_mask_checkbox, inpaint_erode_or_dilate = [None] * 35
+    inpaint_mask_upload_checkbox, invert_mask_checkbox, inpaint_erode_or_dilate, \
+    cfg_skip_after, cfg_reuse_interval, sharpness_end, \
+    tome_ratio, hypertile_enabled, hypertile_tile_size, hypertile_max_depth, \
+    deep_cache_interval, deep_cache_depth, preview_method, upscale_model, latent_upscale_method = [None] * 47
 
 
 def set_all_advanced_parameters(*args):
@@ -18,7 +21,10 @@ def set_all_advanced_parameters(*args):
         refiner_swap_method, \
         freeu_enabled, freeu_b1, freeu_b2, freeu_s1, freeu_s2, \
         debugging_inpaint_preprocessor, inpaint_disable_initial_latent, inpaint_engine, inpaint_strength, inpaint_respective_field, \
-        inpaint_mask_upload_checkbox, invert_mask_checkbox, inpaint_erode_or_dilate
+        inpaint_mask_upload_checkbox, invert_mask_checkbox, inpaint_erode_or_dilate, \
+        cfg_skip_after, cfg_reuse_interval, sharpness_end, \
+        tome_ratio, hypertile_enabled, hypertile_tile_size, hypertile_max_depth, \
+        deep_cache_interval, deep_cache_depth, preview_method, upscale_model, latent_upscale_method
 
     disable_preview, adm_scaler_positive, adm_scaler_negative, adm_scaler_end, adaptive_cfg, sampler_name, \
         scheduler_name, generate_image_grid, overwrite_step, overwrite_switch, overwrite_width, overwrite_height, \
@@ -28,6 +34,9 @@ def set_all_advanced_parameters(*args):
         refiner_swap_method, \
         freeu_enabled, freeu_b1, freeu_b2, freeu_s1, freeu_s2, \
         debugging_inpaint_preprocessor, inpaint_disable_initial_latent, inpaint_engine, inpaint_strength, inpaint_respective_field, \
-        inpaint_mask_upload_checkbox, invert_mask_checkbox, inpaint_erode_or_dilate = args
+        inpaint_mask_upload_checkbox, invert_mask_checkbox, inpaint_erode_or_dilate, \
+        cfg_skip_after, cfg_reuse_interval, sharpness_end, \
+        tome_ratio, hypertile_enabled, hypertile_tile_size, hypertile_max_depth, \
+        deep_cache_interval, deep_cache_depth, preview_method, upscale_model, latent_upscale_method = args
 
     return
@@ -87,31 +87,40 @@ def _bilateral_blur(
 
     ky, kx = _unpack_2d_ks(kernel_size)
     pad_y, pad_x = _compute_zero_padding(kernel_size)
+    height = input.shape[-2]
 
     padded_input = pad(input, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
-    unfolded_input = padded_input.unfold(2, ky, 1).unfold(3, kx, 1).flatten(-2)  # (B, C, H, W, Ky x Kx)
 
     if guidance is None:
         guidance = input
-        unfolded_guidance = unfolded_input
+        padded_guidance = padded_input
     else:
         padded_guidance = pad(guidance, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
-        unfolded_guidance = padded_guidance.unfold(2, ky, 1).unfold(3, kx, 1).flatten(-2)  # (B, C, H, W, Ky x Kx)
-
-    diff = unfolded_guidance - guidance.unsqueeze(-1)
-    if color_distance_type == "l1":
-        color_distance_sq = diff.abs().sum(1, keepdim=True).square()
-    elif color_distance_type == "l2":
-        color_distance_sq = diff.square().sum(1, keepdim=True)
-    else:
-        raise ValueError("color_distance_type only acceps l1 or l2")
-    color_kernel = (-0.5 / sigma_color**2 * color_distance_sq).exp()  # (B, 1, H, W, Ky x Kx)
 
     space_kernel = get_gaussian_kernel2d(kernel_size, sigma_space, device=input.device, dtype=input.dtype)
-    space_kernel = space_kernel.view(-1, 1, 1, 1, kx * ky)
 
-    kernel = space_kernel * color_kernel
-    out = (unfolded_input * kernel).sum(-1) / kernel.sum(-1)
+    # Accumulate one kernel row at a time, so that only (B, C, H, W, Kx) is ever unfolded instead of Ky x Kx.
+    numerator = torch.zeros_like(input)
+    denominator = torch.zeros_like(input[:, :1])
+
+    for dy in range(ky):
+        unfolded_input = padded_input[:, :, dy:dy + height].unfold(3, kx, 1)  # (B, C, H, W, Kx)
+        unfolded_guidance = padded_guidance[:, :, dy:dy + height].unfold(3, kx, 1)  # (B, C, H, W, Kx)
+
+        diff = unfolded_guidance - guidance.unsqueeze(-1)
+        if color_distance_type == "l1":
+            color_distance_sq = diff.abs().sum(1, keepdim=True).square()
+        elif color_distance_type == "l2":
+            color_distance_sq = diff.square().sum(1, keepdim=True)
+        else:
+            raise ValueError("color_distance_type only acceps l1 or l2")
+        color_kernel = (-0.5 / sigma_color**2 * color_distance_sq).exp()  # (B, 1, H, W, Kx)
+
+        kernel = space_kernel[:, dy].view(-1, 1, 1, 1, kx) * color_kernel
+        numerator += (unfolded_input * kernel).sum(-1)
+        denominator += kernel.sum(-1)
+
+    out = numerator / denominator
     return out
 
 
@@ -44,11 +44,11 @@ def worker():
     import extras.face_crop
     import fooocus_version
 
-    from modules.sdxl_styles import apply_style, apply_wildcards, fooocus_expansion
+    from modules.sdxl_styles import apply_style, apply_wildcards, refresh_wildcards, fooocus_expansion
     from modules.private_logger import log
     from extras.expansion import safe_str
     from modules.util import remove_empty_str, HWC3, resize_image, \
-        get_image_shape_ceil, set_image_shape_ceil, get_shape_ceil, resample_image, erode_or_dilate
+        get_image_shape_ceil, set_image_shape_ceil, get_shape_ceil, get_size_for_shape_ceil, resample_image, erode_or_dilate
     from modules.upscaler import perform_upscale
 
     try:
@@ -180,7 +180,7 @@ def worker():
             print(f'Refiner disabled because base model and refiner are same.')
             refiner_model_name = 'None'
 
-        assert performance_selection in ['Speed', 'Quality', 'Extreme Speed', 'Turbo']
+        assert performance_selection in ['Speed', 'Quality', 'Extreme Speed', 'Turbo', 'Draft']
 
         steps = 30
 
@@ -193,6 +193,13 @@ def worker():
         if performance_selection == 'Turbo':
             steps = 5
 
+        if performance_selection == 'Draft' or advanced_parameters.preview_method == flags.preview_taesd:
+            progressbar(async_task, 1, 'Downloading TAESD components ...')
+            modules.config.downloading_taesd_decoder(is_sdxl=True)
+
+        if performance_selection == 'Draft':
+            print('Enter draft mode, images are decoded with TAESD.')
+
         if performance_selection == 'Extreme Speed':
             print('Enter LCM mode.')
             progressbar(async_task, 1, 'Downloading LCM components ...')
@@ -219,6 +226,25 @@ def worker():
         modules.patch.sharpness = sharpness
         print(f'[Parameters] Sharpness = {modules.patch.sharpness}')
 
+        modules.patch.cfg_skip_after = advanced_parameters.cfg_skip_after
+        modules.patch.cfg_reuse_interval = int(advanced_parameters.cfg_reuse_interval)
+        modules.patch.sharpness_end = advanced_parameters.sharpness_end
+        print(f'[Parameters] Guidance Schedule = '
+              f'{modules.patch.cfg_skip_after} : '
+              f'{modules.patch.cfg_reuse_interval} : '
+              f'{modules.patch.sharpness_end}')
+
+        deep_cache_interval, deep_cache_depth = modules.config.default_deep_cache.get(performance_selection, [1, 1])
+        if advanced_parameters.deep_cache_interval > 0:
+            deep_cache_interval = advanced_parameters.deep_cache_interval
+        if advanced_parameters.deep_cache_depth > 0:
+            deep_cache_depth = advanced_parameters.deep_cache_depth
+        modules.patch.deep_cache_interval = int(deep_cache_interval)
+        modules.patch.deep_cache_depth = int(deep_cache_depth)
+        print(f'[Parameters] Deep Cache = '
+              f'{modules.patch.deep_cache_interval} : '
+              f'{modules.patch.deep_cache_depth}')
+
         modules.patch.positive_adm_scale = advanced_parameters.adm_scaler_positive
         modules.patch.negative_adm_scale = advanced_parameters.adm_scaler_negative
         modules.patch.adm_scaler_end = advanced_parameters.adm_scaler_end
@@ -394,6 +420,7 @@ def worker():
                                         use_synthetic_refiner=use_synthetic_refiner)
 
             progressbar(async_task, 3, 'Processing prompts ...')
+            refresh_wildcards()
             tasks = []
             for i in range(image_number):
                 task_seed = (seed + i) % (constants.MAX_SEED + 1)  # randint is inclusive, % is not
@@ -439,23 +466,40 @@ def worker():
                 ))
 
             if use_expansion:
-                for i, t in enumerate(tasks):
-                    progressbar(async_task, 5, f'Preparing Fooocus text #{i + 1} ...')
-                    expansion = pipeline.final_expansion(t['task_prompt'], t['task_seed'])
-                    print(f'[Prompt Expansion] {expansion}')
-                    t['expansion'] = expansion
-                    t['positive'] = copy.deepcopy(t['positive']) + [expansion]  # Deep copy.
+                progressbar(async_task, 5, 'Preparing Fooocus text ...')
+                expansion_prompts = list(dict.fromkeys([t['task_prompt'] for t in tasks]))
+                for expansion_prompt in expansion_prompts:
+                    expansion_tasks = [t for t in tasks if t['task_prompt'] == expansion_prompt]
+                    expansions = pipeline.final_expansion.expand_batch(
+                        expansion_prompt, [t['task_seed'] for t in expansion_tasks])
+                    for t, expansion in zip(expansion_tasks, expansions):
+                        print(f'[Prompt Expansion] {expansion}')
+                        t['expansion'] = expansion
+                        t['positive'] = copy.deepcopy(t['positive']) + [expansion]  # Deep copy.
+
+            # Identical workloads share one conditioning by reference.
+            # It is freed by refcount once the last task using it has been sampled.
+            unique_conds = {}
 
             for i, t in enumerate(tasks):
-                progressbar(async_task, 7, f'Encoding positive #{i + 1} ...')
-                t['c'] = pipeline.clip_encode(texts=t['positive'], pool_top_k=t['positive_top_k'])
+                workload = (tuple(t['positive']), t['positive_top_k'])
+                if workload not in unique_conds:
+                    progressbar(async_task, 7, f'Encoding positive #{i + 1} ...')
+                    unique_conds[workload] = pipeline.clip_encode(texts=t['positive'], pool_top_k=t['positive_top_k'])
+                t['c'] = unique_conds[workload]
 
             for i, t in enumerate(tasks):
                 if abs(float(cfg_scale) - 1.0) < 1e-4:
-                    t['uc'] = pipeline.clone_cond(t['c'])
-                else:
+                    # uncond is never evaluated when cfg is 1, and sampling does not modify conds in place
+                    t['uc'] = t['c']
+                    continue
+                workload = (tuple(t['negative']), t['negative_top_k'])
+                if workload not in unique_conds:
                     progressbar(async_task, 10, f'Encoding negative #{i + 1} ...')
-                    t['uc'] = pipeline.clip_encode(texts=t['negative'], pool_top_k=t['negative_top_k'])
+                    unique_conds[workload] = pipeline.clip_encode(texts=t['negative'], pool_top_k=t['negative_top_k'])
+                t['uc'] = unique_conds[workload]
+
+            del unique_conds
 
         if len(goals) > 0:
             progressbar(async_task, 13, 'Image processing ...')
@@ -494,10 +538,41 @@ def worker():
             height = H * 8
             print(f'Final resolution is {str((height, width))}.')
 
-        if 'upscale' in goals:
+        latent_upscale = False
+        if 'upscale' in goals and 'fast' not in uov_method \
+                and advanced_parameters.latent_upscale_method != flags.disabled:
+            H, W, C = uov_input_image.shape
+            f = 1.5 if '1.5x' in uov_method else 2.0
+            shape_ceil = max(get_shape_ceil(H * f, W * f), 1024)
+            latent_upscale = shape_ceil <= 2800
+
+        if latent_upscale:
+            denoising_strength = 0.5
+
+            if advanced_parameters.overwrite_upscale_strength > 0:
+                denoising_strength = advanced_parameters.overwrite_upscale_strength
+
+            initial_pixels = core.numpy_to_pytorch(uov_input_image)
+            progressbar(async_task, 13, 'VAE encoding ...')
+
+            candidate_vae, _ = pipeline.get_candidate_vae(
+                steps=steps,
+                switch=switch,
+                denoise=denoising_strength,
+                refiner_swap_method=refiner_swap_method
+            )
+
+            initial_latent = core.encode_vae(vae=candidate_vae, pixels=initial_pixels)
+            height, width = get_size_for_shape_ceil(H, W, shape_ceil)
+            progressbar(async_task, 13, f'Upscaling latent from {str((H, W))} ...')
+            initial_latent = core.upscale_latent(initial_latent, width=width, height=height,
+                                                 method=advanced_parameters.latent_upscale_method)
+            print(f'Final resolution is {str((height, width))}.')
+
+        if 'upscale' in goals and not latent_upscale:
             H, W, C = uov_input_image.shape
             progressbar(async_task, 13, f'Upscaling image from {str((H, W))} ...')
-            uov_input_image = perform_upscale(uov_input_image)
+            uov_input_image = perform_upscale(uov_input_image, advanced_parameters.upscale_model)
             print(f'Image upscaled.')
 
             if '1.5x' in uov_method:
@@ -714,6 +789,30 @@ def worker():
                 advanced_parameters.freeu_s2
             )
 
+        if advanced_parameters.tome_ratio > 0:
+            print(f'[Parameters] Token Merging Ratio = {advanced_parameters.tome_ratio}')
+            pipeline.final_unet = core.apply_tome(pipeline.final_unet, advanced_parameters.tome_ratio)
+            if pipeline.final_refiner_unet is not None:
+                pipeline.final_refiner_unet = core.apply_tome(pipeline.final_refiner_unet, advanced_parameters.tome_ratio)
+
+        if advanced_parameters.hypertile_enabled and advanced_parameters.tome_ratio > 0:
+            # ToMe merges the tokens before HyperTile sees them, so HyperTile would silently do nothing.
+            print('[Parameters] HyperTile is ignored because Token Merging is enabled.')
+        elif advanced_parameters.hypertile_enabled:
+            print(f'[Parameters] HyperTile = {advanced_parameters.hypertile_tile_size} : '
+                  f'{advanced_parameters.hypertile_max_depth}')
+            pipeline.final_unet = core.apply_hypertile(
+                pipeline.final_unet,
+                int(advanced_parameters.hypertile_tile_size),
+                int(advanced_parameters.hypertile_max_depth)
+            )
+            if pipeline.final_refiner_unet is not None:
+                pipeline.final_refiner_unet = core.apply_hypertile(
+                    pipeline.final_refiner_unet,
+                    int(advanced_parameters.hypertile_tile_size),
+                    int(advanced_parameters.hypertile_max_depth)
+                )
+
         all_steps = steps * image_number
 
         print(f'[Parameters] Denoising Strength = {denoising_strength}')
@@ -758,7 +857,7 @@ def worker():
             execution_start_time = time.perf_counter()
 
             try:
-                positive_cond, negative_cond = task['c'], task['uc']
+                positive_cond, negative_cond = task.pop('c'), task.pop('uc')
 
                 if 'cn' in goals:
                     for cn_flag, cn_path in [
@@ -785,10 +884,11 @@ def worker():
                     denoise=denoising_strength,
                     tiled=tiled,
                     cfg_scale=cfg_scale,
-                    refiner_swap_method=refiner_swap_method
+                    refiner_swap_method=refiner_swap_method,
+                    draft_decode=performance_selection == 'Draft'
                 )
 
-                del task['c'], task['uc'], positive_cond, negative_cond  # Save memory
+                del positive_cond, negative_cond  # Save memory
 
                 if inpaint_worker.current_task is not None:
                     imgs = [inpaint_worker.current_task.post_process(x) for x in imgs]
@@ -319,6 +319,17 @@ default_overwrite_switch = get_config_item_or_set_default(
     default_value=-1,
     validator=lambda x: isinstance(x, int)
 )
+default_preview_method = get_config_item_or_set_default(
+    key='default_preview_method',
+    default_value=modules.flags.preview_vae_approx,
+    validator=lambda x: x in modules.flags.preview_methods
+)
+default_deep_cache = get_config_item_or_set_default(
+    key='default_deep_cache',
+    default_value={k: [1, 1] for k in modules.flags.performance_selections + ['Turbo']},
+    validator=lambda x: isinstance(x, dict) and all(
+        isinstance(v, list) and len(v) == 2 and all(isinstance(n, int) and n > 0 for n in v) for v in x.values())
+)
 example_inpaint_prompts = get_config_item_or_set_default(
     key='example_inpaint_prompts',
     default_value=[
@@ -341,6 +352,7 @@ possible_preset_keys = [
     "default_sampler",
     "default_scheduler",
     "default_performance",
+    "default_deep_cache",
     "default_prompt",
     "default_prompt_negative",
     "default_styles",
@@ -401,6 +413,7 @@ os.makedirs(path_outputs, exist_ok=True)
 
 model_filenames = []
 lora_filenames = []
+upscale_model_filenames = []
 
 
 def get_model_filenames(folder_path, name_filter=None):
@@ -408,9 +421,11 @@ def get_model_filenames(folder_path, name_filter=None):
 
 
 def update_all_model_names():
-    global model_filenames, lora_filenames
+    global model_filenames, lora_filenames, upscale_model_filenames
     model_filenames = get_model_filenames(path_checkpoints)
     lora_filenames = get_model_filenames(path_loras)
+    upscale_model_filenames = [modules.flags.upscale_model_default] + \
+        [f for f in get_model_filenames(path_upscale_models) if f != 'fooocus_upscaler_s409985e5.bin']
     return
 
 
@@ -461,6 +476,16 @@ def downloading_sdxl_lcm_lora():
     return 'sdxl_lcm_lora.safetensors'
 
 
+def downloading_taesd_decoder(is_sdxl):
+    file_name = 'taesdxl_decoder.pth' if is_sdxl else 'taesd_decoder.pth'
+    load_file_from_url(
+        url=f'https://github.com/madebyollin/taesd/raw/main/{file_name}',
+        model_dir=path_vae_approx,
+        file_name=file_name
+    )
+    return os.path.join(path_vae_approx, file_name)
+
+
 def downloading_controlnet_canny():
     load_file_from_url(
         url='https://huggingface.co/lllyasviel/misc/resolve/main/control-lora-canny-rank128.safetensors',
@@ -7,6 +7,7 @@ import os
 import einops
 import torch
 import numpy as np
+import args_manager
 
 import ldm_patched.modules.model_management
 import ldm_patched.modules.model_detection
@@ -14,15 +15,20 @@ import ldm_patched.modules.model_patcher
 import ldm_patched.modules.utils
 import ldm_patched.modules.controlnet
 import modules.sample_hijack
+import modules.preview_worker
 import ldm_patched.modules.samplers
 import ldm_patched.modules.latent_formats
 import modules.advanced_parameters
+import modules.flags
 
 from ldm_patched.modules.sd import load_checkpoint_guess_config
 from ldm_patched.contrib.external import VAEDecode, EmptyLatentImage, VAEEncode, VAEEncodeTiled, VAEDecodeTiled, \
-    ControlNetApplyAdvanced
+    ControlNetApplyAdvanced, LatentUpscale
 from ldm_patched.contrib.external_freelunch import FreeU_V2
+from ldm_patched.contrib.external_tomesd import TomePatchModel
+from ldm_patched.contrib.external_hypertile import HyperTile
 from ldm_patched.modules.sample import prepare_mask
+from ldm_patched.taesd.taesd import TAESD
 from modules.lora import match_lora
 from ldm_patched.modules.lora import model_lora_keys_unet, model_lora_keys_clip
 from modules.config import path_embeddings
@@ -34,8 +40,11 @@ opVAEDecode = VAEDecode()
 opVAEEncode = VAEEncode()
 opVAEDecodeTiled = VAEDecodeTiled()
 opVAEEncodeTiled = VAEEncodeTiled()
+opLatentUpscale = LatentUpscale()
 opControlNetApplyAdvanced = ControlNetApplyAdvanced()
 opFreeU = FreeU_V2()
+opTomePatchModel = TomePatchModel()
+opHyperTile = HyperTile()
 opModelSamplingDiscrete = ModelSamplingDiscrete()
 
 
@@ -132,6 +141,19 @@ def apply_freeu(model, b1, b2, s1, s2):
     return opFreeU.patch(model=model, b1=b1, b2=b2, s1=s1, s2=s2)[0]
 
 
+@torch.no_grad()
+@torch.inference_mode()
+def apply_tome(model, ratio):
+    return opTomePatchModel.patch(model=model, ratio=ratio)[0]
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def apply_hypertile(model, tile_size, max_depth, swap_size=2, scale_depth=False):
+    return opHyperTile.patch(model=model, tile_size=tile_size, swap_size=swap_size,
+                             max_depth=max_depth, scale_depth=scale_depth)[0]
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def load_controlnet(ckpt_filename):
@@ -158,6 +180,39 @@ def generate_empty_latent(width=1024, height=1024, batch_size=1):
     return opEmptyLatentImage.generate(width=width, height=height, batch_size=batch_size)[0]
 
 
+noise_copy_events = {}
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def generate_noise(latent_image, seed, device):
+    # Same bytes as prepare_noise. A CUDA generator gives another stream for the same seed, so the noise is
+    # still drawn by the CPU generator, into a pooled pinned buffer, and copied into a pooled device buffer.
+    # The noise is only used by the sampling of this call, so the device buffer is not handed out further.
+    device = torch.device(device)
+    if device.type == 'cpu':
+        return ldm_patched.modules.sample.prepare_noise(latent_image, seed)
+
+    pin_memory = device.type == 'cuda'
+    key = (tuple(latent_image.shape), latent_image.dtype)
+    host = ldm_patched.modules.model_management.get_pooled_buffer(
+        'noise_host', latent_image.shape, latent_image.dtype, 'cpu', pin_memory=pin_memory)
+
+    # The previous asynchronous copy out of this host buffer must be done before it is overwritten.
+    if key in noise_copy_events:
+        noise_copy_events.pop(key).synchronize()
+
+    torch.randn(latent_image.shape, dtype=latent_image.dtype, generator=torch.manual_seed(seed), out=host)
+    noise = ldm_patched.modules.model_management.get_pooled_buffer('noise', latent_image.shape, latent_image.dtype, device)
+    noise.copy_(host, non_blocking=pin_memory)
+
+    if pin_memory:
+        event = torch.cuda.Event()
+        event.record(torch.cuda.current_stream(device))
+        noise_copy_events[key] = event
+    return noise
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def decode_vae(vae, latent_image, tiled=False):
@@ -167,6 +222,28 @@ def decode_vae(vae, latent_image, tiled=False):
         return opVAEDecode.decode(samples=latent_image, vae=vae)[0]
 
 
+def decode_vae_stream(vae, latent_image, band=32):
+    return vae.decode_stream(latent_image['samples'], band=band)
+
+
+def decode_vae_to_numpy(vae, latent_image, tiled=False):
+    samples = latent_image['samples']
+    B, C, H, W = samples.shape
+
+    if tiled:
+        return pytorch_to_numpy(decode_vae(vae=vae, latent_image=latent_image, tiled=True))
+
+    if not args_manager.args.vae_stream_decode or max(H, W) * vae.downscale_ratio < 2048:
+        return pytorch_to_numpy(decode_vae(vae=vae, latent_image=latent_image))
+
+    # Opt-in: large images are decoded in bands straight into uint8, without a full size float buffer.
+    # The bands only see a few rows of context in the global attention, so this is not identical to a full decode.
+    images = [np.empty((H * vae.downscale_ratio, W * vae.downscale_ratio, 3), dtype=np.uint8) for _ in range(B)]
+    for index, y, rows in decode_vae_stream(vae=vae, latent_image=latent_image):
+        images[index][y:y + rows.shape[0]] = rows
+    return images
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def encode_vae(vae, pixels, tiled=False):
@@ -176,6 +253,12 @@ def encode_vae(vae, pixels, tiled=False):
         return opVAEEncode.encode(pixels=pixels, vae=vae)[0]
 
 
+@torch.no_grad()
+@torch.inference_mode()
+def upscale_latent(latent_image, width, height, method='bislerp'):
+    return opLatentUpscale.upscale(samples=latent_image, upscale_method=method, width=width, height=height, crop='disabled')[0]
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def encode_vae_inpaint(vae, pixels, mask):
@@ -220,55 +303,114 @@ class VAEApprox(torch.nn.Module):
 
 
 VAE_approx_models = {}
+TAESD_models = {}
 
 
-@torch.no_grad()
-@torch.inference_mode()
-def get_previewer(model):
-    global VAE_approx_models
-
+def get_vae_approx(model):
     from modules.config import path_vae_approx
     is_sdxl = isinstance(model.model.latent_format, ldm_patched.modules.latent_formats.SDXL)
     vae_approx_filename = os.path.join(path_vae_approx, 'xlvaeapp.pth' if is_sdxl else 'vaeapp_sd15.pth')
 
     if vae_approx_filename in VAE_approx_models:
-        VAE_approx_model = VAE_approx_models[vae_approx_filename]
+        return VAE_approx_models[vae_approx_filename]
+
+    sd = torch.load(vae_approx_filename, map_location='cpu')
+    VAE_approx_model = VAEApprox()
+    VAE_approx_model.load_state_dict(sd)
+    del sd
+    VAE_approx_model.eval()
+
+    if ldm_patched.modules.model_management.should_use_fp16():
+        VAE_approx_model.half()
+        VAE_approx_model.current_type = torch.float16
     else:
-        sd = torch.load(vae_approx_filename, map_location='cpu')
-        VAE_approx_model = VAEApprox()
-        VAE_approx_model.load_state_dict(sd)
-        del sd
-        VAE_approx_model.eval()
-
-        if ldm_patched.modules.model_management.should_use_fp16():
-            VAE_approx_model.half()
-            VAE_approx_model.current_type = torch.float16
-        else:
-            VAE_approx_model.float()
-            VAE_approx_model.current_type = torch.float32
+        VAE_approx_model.float()
+        VAE_approx_model.current_type = torch.float32
+
+    VAE_approx_model.to(ldm_patched.modules.model_management.get_torch_device())
+    VAE_approx_models[vae_approx_filename] = VAE_approx_model
+    return VAE_approx_model
+
+
+def get_taesd(model):
+    from modules.config import downloading_taesd_decoder
+    is_sdxl = isinstance(model.model.latent_format, ldm_patched.modules.latent_formats.SDXL)
+    taesd_filename = downloading_taesd_decoder(is_sdxl)
+
+    if taesd_filename in TAESD_models:
+        return TAESD_models[taesd_filename]
 
-        VAE_approx_model.to(ldm_patched.modules.model_management.get_torch_device())
-        VAE_approx_models[vae_approx_filename] = VAE_approx_model
+    taesd = TAESD(decoder_path=taesd_filename).eval()
+    taesd.current_type = torch.float16 if ldm_patched.modules.model_management.should_use_fp16() else torch.float32
+    taesd.to(device=ldm_patched.modules.model_management.get_torch_device(), dtype=taesd.current_type)
+    TAESD_models[taesd_filename] = taesd
+    return taesd
+
+
+def rgb_to_numpy(x):
+    # Converted to uint8 on the device, so only a quarter of the bytes are copied back.
+    x = einops.rearrange(torch.clamp(x, 0, 255), 'b c h w -> b h w c').to(torch.uint8)
+    return [y for y in x.cpu().numpy()]
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def get_previewer(model):
+    method = modules.advanced_parameters.preview_method or modules.flags.preview_vae_approx
+
+    if method == modules.flags.preview_taesd:
+        taesd = get_taesd(model)
+
+        @torch.no_grad()
+        @torch.inference_mode()
+        def preview_function(x0, step, total_steps):
+            x_sample = taesd.decode(x0[:1].to(taesd.current_type)) * 127.5 + 127.5
+            return rgb_to_numpy(x_sample)[0]
+
+        return preview_function
+
+    if method == modules.flags.preview_latent_rgb:
+        latent_rgb_factors = torch.tensor(model.model.latent_format.latent_rgb_factors,
+                                          device=ldm_patched.modules.model_management.get_torch_device())
+
+        @torch.no_grad()
+        @torch.inference_mode()
+        def preview_function(x0, step, total_steps):
+            x_sample = torch.einsum('bchw,cr->brhw', x0[:1].to(latent_rgb_factors), latent_rgb_factors) * 127.5 + 127.5
+            return rgb_to_numpy(x_sample)[0]
+
+        return preview_function
+
+    VAE_approx_model = get_vae_approx(model)
 
     @torch.no_grad()
     @torch.inference_mode()
     def preview_function(x0, step, total_steps):
-        with torch.no_grad():
-            x_sample = x0.to(VAE_approx_model.current_type)
-            x_sample = VAE_approx_model(x_sample) * 127.5 + 127.5
-            x_sample = einops.rearrange(x_sample, 'b c h w -> b h w c')[0]
-            x_sample = x_sample.cpu().numpy().clip(0, 255).astype(np.uint8)
-            return x_sample
+        x_sample = x0[:1].to(VAE_approx_model.current_type)
+        x_sample = VAE_approx_model(x_sample) * 127.5 + 127.5
+        return rgb_to_numpy(x_sample)[0]
 
     return preview_function
 
 
+@torch.no_grad()
+@torch.inference_mode()
+def decode_taesd_to_numpy(model, latent_image):
+    taesd = get_taesd(model)
+    samples = model.model.latent_format.process_in(latent_image['samples'])
+    images = []
+    for x in samples:
+        x_sample = taesd.decode(x[None].to(device=ldm_patched.modules.model_management.get_torch_device(), dtype=taesd.current_type))
+        images += rgb_to_numpy(x_sample * 127.5 + 127.5)
+    return images
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sampler_name='dpmpp_2m_sde_gpu',
              scheduler='karras', denoise=1.0, disable_noise=False, start_step=None, last_step=None,
              force_full_denoise=False, callback_function=None, refiner=None, refiner_switch=-1,
-             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None):
+             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, noise_sampler=None):
 
     if sigmas is not None:
         sigmas = sigmas.clone().to(ldm_patched.modules.model_management.get_torch_device())
@@ -279,10 +421,14 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
         noise = torch.zeros(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, device="cpu")
     else:
         batch_inds = latent["batch_index"] if "batch_index" in latent else None
-        noise = ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
+        if batch_inds is None:
+            noise = generate_noise(latent_image, seed, model.load_device)
+        else:
+            noise = ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
 
     if isinstance(noise_mean, torch.Tensor):
-        noise = noise + noise_mean - torch.mean(noise, dim=1, keepdim=True)
+        noise = noise.to(noise_mean.device)
+        noise = noise + noise_mean.to(noise) - torch.mean(noise, dim=1, keepdim=True)
 
     noise_mask = None
     if "noise_mask" in latent:
@@ -298,11 +444,17 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
 
     def callback(step, x0, x, total_steps):
         ldm_patched.modules.model_management.throw_exception_if_processing_interrupted()
-        y = None
+        if callback_function is None:
+            return
+        # Progress is reported every step with the latest rendered preview, only the rendering is rate limited.
+        callback_function(previewer_start + step, x0, x, previewer_end, modules.preview_worker.get_latest_preview())
         if previewer is not None and not modules.advanced_parameters.disable_preview:
-            y = previewer(x0, previewer_start + step, previewer_end)
-        if callback_function is not None:
-            callback_function(previewer_start + step, x0, x, previewer_end, y)
+            modules.preview_worker.submit(previewer, callback_function, previewer_start + step, x0, x, previewer_end)
+
+    # The noise sampler belongs to this run, so that the refiner pass continues the same Brownian tree.
+    model_options = model.model_options
+    if noise_sampler is not None:
+        model_options = {**model_options, 'noise_sampler': noise_sampler}
 
     disable_pbar = False
     modules.sample_hijack.current_refiner = refiner
@@ -318,12 +470,14 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
                                                     last_step=last_step,
                                                     force_full_denoise=force_full_denoise, noise_mask=noise_mask,
                                                     callback=callback,
-                                                    disable_pbar=disable_pbar, seed=seed, sigmas=sigmas)
+                                                    disable_pbar=disable_pbar, seed=seed, sigmas=sigmas,
+                                                    model_options=model_options)
 
         out = latent.copy()
         out["samples"] = samples
     finally:
         modules.sample_hijack.current_refiner = None
+        modules.preview_worker.flush()
 
     return out
 
@@ -1,5 +1,6 @@
 import modules.core as core
 import os
+import time
 import torch
 import modules.patch
 import modules.config
@@ -10,7 +11,7 @@ import extras.vae_interpose as vae_interpose
 from extras.expansion import FooocusExpansion
 
 from ldm_patched.modules.model_base import SDXL, SDXLRefiner
-from modules.sample_hijack import clip_separate
+from modules.sample_hijack import clip_separate, get_model_sampling_signature
 
 
 model_base = core.StableDiffusionModel()
@@ -24,6 +25,7 @@ final_refiner_unet = None
 final_refiner_vae = None
 
 loaded_ControlNets = {}
+sigma_range_cache = {}
 
 
 @torch.no_grad()
@@ -208,7 +210,10 @@ def prepare_text_encoder(async_call=True):
         # TODO: make sure that this is always called in an async way so that users cannot feel it.
         pass
     assert_model_integrity()
-    ldm_patched.modules.model_management.load_models_gpu([final_clip.patcher, final_expansion.patcher])
+    models = [final_clip.patcher]
+    if final_expansion.patcher is not None:
+        models.append(final_expansion.patcher)
+    ldm_patched.modules.model_management.load_models_gpu(models)
     return
 
 
@@ -296,6 +301,14 @@ def calculate_sigmas(sampler, model, scheduler, steps, denoise):
     return sigmas
 
 
+def calculate_sigma_range(sampler, model, scheduler, steps, denoise):
+    key = (get_model_sampling_signature(model.model_sampling), sampler, scheduler, steps, denoise)
+    if key not in sigma_range_cache:
+        sigmas = calculate_sigmas(sampler=sampler, model=model, scheduler=scheduler, steps=steps, denoise=denoise)
+        sigma_range_cache[key] = float(sigmas[sigmas > 0].min()), float(sigmas.max())
+    return sigma_range_cache[key]
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def get_candidate_vae(steps, switch, denoise=1.0, refiner_swap_method='joint'):
@@ -315,7 +328,7 @@ def get_candidate_vae(steps, switch, denoise=1.0, refiner_swap_method='joint'):
 
 @torch.no_grad()
 @torch.inference_mode()
-def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint'):
+def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', draft_decode=False):
     target_unet, target_vae, target_refiner_unet, target_refiner_vae, target_clip \
         = final_unet, final_vae, final_refiner_unet, final_refiner_vae, final_clip
 
@@ -345,17 +358,15 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
     else:
         initial_latent = latent
 
-    minmax_sigmas = calculate_sigmas(sampler=sampler_name, scheduler=scheduler_name, model=final_unet.model, steps=steps, denoise=denoise)
-    sigma_min, sigma_max = minmax_sigmas[minmax_sigmas > 0].min(), minmax_sigmas.max()
-    sigma_min = float(sigma_min.cpu().numpy())
-    sigma_max = float(sigma_max.cpu().numpy())
+    sigma_min, sigma_max = calculate_sigma_range(sampler=sampler_name, scheduler=scheduler_name, model=final_unet.model, steps=steps, denoise=denoise)
     print(f'[Sampler] sigma_min = {sigma_min}, sigma_max = {sigma_max}')
 
-    modules.patch.BrownianTreeNoiseSamplerPatched.global_init(
+    noise_sampler = modules.patch.BrownianTreeNoiseSamplerPatched(
         initial_latent['samples'].to(ldm_patched.modules.model_management.get_torch_device()),
         sigma_min, sigma_max, seed=image_seed, cpu=False)
 
-    decoded_latent = None
+    target_model = None
+    latent_unet = target_unet  # the UNet whose latent space sampled_latent is in
 
     if refiner_swap_method == 'joint':
         sampled_latent = core.ksampler(
@@ -374,8 +385,9 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             refiner_switch=switch,
             previewer_start=0,
             previewer_end=steps,
+            noise_sampler=noise_sampler
         )
-        decoded_latent = core.decode_vae(vae=target_vae, latent_image=sampled_latent, tiled=tiled)
+        target_model = target_vae
 
     if refiner_swap_method == 'separate':
         sampled_latent = core.ksampler(
@@ -392,6 +404,7 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
+            noise_sampler=noise_sampler
         )
         print('Refiner swapped by changing ksampler. Noise preserved.')
 
@@ -414,12 +427,13 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=switch,
             previewer_end=steps,
+            noise_sampler=noise_sampler
         )
 
+        latent_unet = target_model
         target_model = target_refiner_vae
         if target_model is None:
             target_model = target_vae
-        decoded_latent = core.decode_vae(vae=target_model, latent_image=sampled_latent, tiled=tiled)
 
     if refiner_swap_method == 'vae':
         modules.patch.eps_record = 'vae'
@@ -440,15 +454,21 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             sampler_name=sampler_name,
             scheduler=scheduler_name,
             previewer_start=0,
-            previewer_end=steps
+            previewer_end=steps,
+            noise_sampler=noise_sampler
         )
         print('Fooocus VAE-based swap.')
+        swap_start_time = time.perf_counter()
 
         target_model = target_refiner_unet
         if target_model is None:
             target_model = target_unet
             print('Use base model to refine itself - this may because of developer mode.')
 
+        if final_refiner_vae is not None:
+            # Load the interposer together with the refiner, so the refiner sampling finds both resident.
+            ldm_patched.modules.model_management.load_models_gpu([vae_interpose.load(), target_model])
+
         sampled_latent = vae_parse(sampled_latent)
 
         k_sigmas = 1.4
@@ -460,6 +480,7 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
         len_sigmas = len(sigmas) - 1
 
         noise_mean = torch.mean(modules.patch.eps_record, dim=1, keepdim=True)
+        print(f'[VAE Swap] Swap overhead: {time.perf_counter() - swap_start_time:.2f} seconds')
 
         if modules.inpaint_worker.current_task is not None:
             modules.inpaint_worker.current_task.swap()
@@ -479,14 +500,19 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             previewer_start=switch,
             previewer_end=steps,
             sigmas=sigmas,
-            noise_mean=noise_mean
+            noise_mean=noise_mean,
+            noise_sampler=noise_sampler
         )
 
+        latent_unet = target_model
         target_model = target_refiner_vae
         if target_model is None:
             target_model = target_vae
-        decoded_latent = core.decode_vae(vae=target_model, latent_image=sampled_latent, tiled=tiled)
 
-    images = core.pytorch_to_numpy(decoded_latent)
+    if draft_decode:
+        images = core.decode_taesd_to_numpy(model=latent_unet, latent_image=sampled_latent)
+    else:
+        images = core.decode_vae_to_numpy(vae=target_model, latent_image=sampled_latent, tiled=tiled)
+
     modules.patch.eps_record = None
     return images
@@ -33,7 +33,15 @@ default_parameters = {
 }  # stop, weight
 
 inpaint_engine_versions = ['None', 'v1', 'v2.5', 'v2.6']
-performance_selections = ['Speed', 'Quality', 'Extreme Speed']
+performance_selections = ['Speed', 'Quality', 'Extreme Speed', 'Draft']
+
+preview_vae_approx = 'VAE Approx'
+preview_taesd = 'TAESD'
+preview_latent_rgb = 'Latent RGB'
+preview_methods = [preview_vae_approx, preview_taesd, preview_latent_rgb]
+
+upscale_model_default = 'Default'
+latent_upscale_methods = [disabled, 'bislerp', 'bicubic', 'nearest-exact']
 
 inpaint_option_default = 'Inpaint or Outpaint (default)'
 inpaint_option_detail = 'Improve Detail (face, hand, eyes, etc.)'
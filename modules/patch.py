@@ -2,6 +2,7 @@ import os
 import torch
 import time
 import math
+import functools
 import ldm_patched.modules.model_base
 import ldm_patched.ldm.modules.diffusionmodules.openaimodel
 import ldm_patched.modules.model_management
@@ -17,6 +18,7 @@ import ldm_patched.controlnet.cldm
 import ldm_patched.modules.model_patcher
 import ldm_patched.modules.samplers
 import ldm_patched.modules.args_parser
+import args_manager
 import modules.advanced_parameters as advanced_parameters
 import warnings
 import safetensors.torch
@@ -36,7 +38,11 @@ positive_adm_scale = 1.5
 negative_adm_scale = 0.8
 
 adaptive_cfg = 7.0
-global_diffusion_progress = 0
+cfg_skip_after = 1.0
+cfg_reuse_interval = 1
+sharpness_end = 1.0
+deep_cache_interval = 1
+deep_cache_depth = 1
 eps_record = None
 
 
@@ -175,29 +181,22 @@ def calculate_weight_patched(self, patches, weight, key):
 
 
 class BrownianTreeNoiseSamplerPatched:
-    transform = None
-    tree = None
-
-    @staticmethod
-    def global_init(x, sigma_min, sigma_max, seed=None, transform=lambda x: x, cpu=False):
+    def __init__(self, x, sigma_min, sigma_max, seed=None, transform=lambda x: x, cpu=False):
         if ldm_patched.modules.model_management.directml_enabled:
             cpu = True
 
         t0, t1 = transform(torch.as_tensor(sigma_min)), transform(torch.as_tensor(sigma_max))
 
-        BrownianTreeNoiseSamplerPatched.transform = transform
-        BrownianTreeNoiseSamplerPatched.tree = BatchedBrownianTree(x, t0, t1, seed, cpu=cpu)
+        self.transform = transform
+        self.tree = BatchedBrownianTree(x, t0, t1, seed, cpu=cpu)
 
-    def __init__(self, *args, **kwargs):
-        pass
+    def __call__(self, sigma, sigma_next):
+        t0, t1 = self.transform(torch.as_tensor(sigma)), self.transform(torch.as_tensor(sigma_next))
+        return self.tree(t0, t1) / (t1 - t0).abs().sqrt()
 
-    @staticmethod
-    def __call__(sigma, sigma_next):
-        transform = BrownianTreeNoiseSamplerPatched.transform
-        tree = BrownianTreeNoiseSamplerPatched.tree
 
-        t0, t1 = transform(torch.as_tensor(sigma)), transform(torch.as_tensor(sigma_next))
-        return tree(t0, t1) / (t1 - t0).abs().sqrt()
+def brownian_tree_noise_sampler(x, sigma_min, sigma_max, seed=None, transform=lambda x: x, cpu=False):
+    return BrownianTreeNoiseSamplerPatched(x, sigma_min, sigma_max, seed=seed, transform=transform, cpu=cpu)
 
 
 def compute_cfg(uncond, cond, cfg_scale, t):
@@ -215,6 +214,11 @@ def compute_cfg(uncond, cond, cfg_scale, t):
         return real_eps
 
 
+def timesteps_to_progress(timesteps):
+    # Only used when the sampler does not provide the progress, this syncs with the device.
+    return float(1.0 - timesteps.flatten()[0] / 999.0)
+
+
 def patched_sampling_function(model, x, timestep, uncond, cond, cond_scale, model_options=None, seed=None):
     global eps_record
 
@@ -222,25 +226,57 @@ def patched_sampling_function(model, x, timestep, uncond, cond, cond_scale, mode
         final_x0 = calc_cond_uncond_batch(model, cond, None, x, timestep, model_options)[0]
 
         if eps_record is not None:
-            eps_record = ((x - final_x0) / timestep).cpu()
+            eps_record = (x - final_x0) / timestep
 
         return final_x0
 
-    positive_x0, negative_x0 = calc_cond_uncond_batch(model, cond, uncond, x, timestep, model_options)
+    transformer_options = model_options.get('transformer_options', {})
+    global_diffusion_progress = transformer_options.get('diffusion_progress', None)
+    if global_diffusion_progress is None:
+        global_diffusion_progress = timesteps_to_progress(model.model_sampling.timestep(timestep))
+
+    skip_uncond = global_diffusion_progress > cfg_skip_after
+
+    if skip_uncond:
+        positive_x0 = calc_cond_uncond_batch(model, cond, None, x, timestep, model_options, pooled_outputs=True)[0]
+        negative_eps = None
+    else:
+        sigma = timestep.reshape([timestep.shape[0]] + [1] * (len(x.shape) - 1))
+        step = transformer_options.get('diffusion_step', None)
+        uncond_cache = model_options.get('uncond_cache', None)
+
+        if cfg_reuse_interval > 1 and uncond_cache is not None and step is not None \
+                and 'step' in uncond_cache and step - uncond_cache['step'] < cfg_reuse_interval \
+                and uncond_cache['noise'].shape == x.shape:
+            positive_x0 = calc_cond_uncond_batch(model, cond, None, x, timestep, model_options, pooled_outputs=True)[0]
+            negative_eps = uncond_cache['noise'] * sigma
+        else:
+            positive_x0, negative_x0 = calc_cond_uncond_batch(model, cond, uncond, x, timestep, model_options,
+                                                              pooled_outputs=True)
+            negative_eps = x - negative_x0
+
+            if cfg_reuse_interval > 1 and uncond_cache is not None and step is not None:
+                uncond_cache['step'] = step
+                uncond_cache['noise'] = negative_eps / sigma
 
     positive_eps = x - positive_x0
-    negative_eps = x - negative_x0
 
     alpha = 0.001 * sharpness * global_diffusion_progress
 
-    positive_eps_degraded = anisotropic.adaptive_anisotropic_filter(x=positive_eps, g=positive_x0)
-    positive_eps_degraded_weighted = positive_eps_degraded * alpha + positive_eps * (1.0 - alpha)
+    if alpha > 0 and global_diffusion_progress <= sharpness_end:
+        positive_eps_degraded = anisotropic.adaptive_anisotropic_filter(x=positive_eps, g=positive_x0)
+        positive_eps_degraded_weighted = positive_eps_degraded * alpha + positive_eps * (1.0 - alpha)
+    else:
+        positive_eps_degraded_weighted = positive_eps
 
-    final_eps = compute_cfg(uncond=negative_eps, cond=positive_eps_degraded_weighted,
-                            cfg_scale=cond_scale, t=global_diffusion_progress)
+    if skip_uncond:
+        final_eps = positive_eps_degraded_weighted
+    else:
+        final_eps = compute_cfg(uncond=negative_eps, cond=positive_eps_degraded_weighted,
+                                cfg_scale=cond_scale, t=global_diffusion_progress)
 
     if eps_record is not None:
-        eps_record = (final_eps / timestep).cpu()
+        eps_record = final_eps / timestep
 
     return x - final_eps
 
@@ -366,11 +402,46 @@ def patched_cldm_forward(self, x, hint, timesteps, context, y=None, **kwargs):
 
 
 def patched_unet_forward(self, x, timesteps=None, context=None, y=None, control=None, transformer_options={}, **kwargs):
-    global global_diffusion_progress
+    return unet_forward_inner(self, x, timesteps, context, y, control, transformer_options, **kwargs)
+
+
+# Every resolution, batch size and cond layout is one recompile of unet_forward_inner.
+compile_cache_size_limit = 64
 
-    self.current_step = 1.0 - timesteps.to(x) / 999.0
-    global_diffusion_progress = float(self.current_step.detach().cpu().numpy().tolist()[0])
 
+def compiled_unet_forward(self, x, timesteps=None, context=None, y=None, control=None, transformer_options={}, **kwargs):
+    transformer_patches = transformer_options.get("patches", {})
+    if control is not None or any(len(p) > 0 for p in transformer_patches.values()) \
+            or len(transformer_options.get("patches_replace", {})) > 0:
+        # ControlNets and transformer patches (IP-Adapter, ToMe, HyperTile, ...) are closures over per-step state,
+        # they are not part of the signature and any of them sends the whole call back to eager.
+        return patched_unet_forward(self, x, timesteps, context, y, control, transformer_options, **kwargs)
+
+    signature = (tuple(x.shape), x.dtype, str(x.device),
+                 None if context is None else tuple(context.shape),
+                 None if y is None else tuple(y.shape),
+                 tuple(sorted(kwargs.keys())),
+                 tuple(transformer_options.get("cond_or_uncond", [])))
+
+    compiled_forwards = getattr(self, 'compiled_forwards', None)
+    if compiled_forwards is None:
+        compiled_forwards = self.compiled_forwards = {}
+
+    # The wrappers are cached on the UNet and only avoid rebuilding them: dynamo tracks recompiles per code object,
+    # so all signatures of all UNets share the recompile limit of unet_forward_inner, raised when installed.
+    compiled_forward = compiled_forwards.get(signature, None)
+    if compiled_forward is None:
+        print(f'[UNet] Compiling for {signature[0]} ...')
+        compiled_forward = torch.compile(functools.partial(unet_forward_inner, self), dynamic=False)
+        compiled_forwards[signature] = compiled_forward
+
+    # Only the cond/uncond layout, constant for a signature, and the sigmas tensor, which is a graph input,
+    # are passed. Python floats such as the step progress would be specialized on and recompile every step.
+    static_options = {k: transformer_options[k] for k in ["cond_or_uncond", "sigmas"] if k in transformer_options}
+    return compiled_forward(x, timesteps, context, y, None, static_options, **kwargs)
+
+
+def unet_forward_inner(self, x, timesteps, context, y, control, transformer_options, **kwargs):
     y = timed_adm(y, timesteps)
 
     transformer_options["original_shape"] = list(x.shape)
@@ -392,8 +463,24 @@ def patched_unet_forward(self, x, timesteps=None, context=None, y=None, control=
         assert y.shape[0] == x.shape[0]
         emb = emb + self.label_emb(y)
 
+    # DeepCache: on intermediate steps only the shallow blocks run, the deep features come from the last full step.
+    feature_cache = transformer_options.get("feature_cache", None)
+    diffusion_step = transformer_options.get("diffusion_step", None)
+    shallow_blocks = min(max(int(deep_cache_depth), 1), len(self.input_blocks) - 1)
+    cache_key = (tuple(x.shape), tuple(transformer_options.get("cond_or_uncond", [])))
+    cached_features = None
+
+    if deep_cache_interval > 1 and feature_cache is not None and diffusion_step is not None and control is None:
+        cached_features = feature_cache.get(cache_key, None)
+        if cached_features is not None and diffusion_step - cached_features[0] >= deep_cache_interval:
+            cached_features = None
+    else:
+        feature_cache = None
+
     h = x
     for id, module in enumerate(self.input_blocks):
+        if cached_features is not None and id >= shallow_blocks:
+            break
         transformer_options["block"] = ("input", id)
         h = forward_timestep_embed(module, h, emb, context, transformer_options, time_context=time_context, num_video_frames=num_video_frames, image_only_indicator=image_only_indicator)
         h = apply_control(h, control, 'input')
@@ -408,11 +495,20 @@ def patched_unet_forward(self, x, timesteps=None, context=None, y=None, control=
             for p in patch:
                 h = p(h, transformer_options)
 
-    transformer_options["block"] = ("middle", 0)
-    h = forward_timestep_embed(self.middle_block, h, emb, context, transformer_options, time_context=time_context, num_video_frames=num_video_frames, image_only_indicator=image_only_indicator)
-    h = apply_control(h, control, 'middle')
+    if cached_features is None:
+        transformer_options["block"] = ("middle", 0)
+        h = forward_timestep_embed(self.middle_block, h, emb, context, transformer_options, time_context=time_context, num_video_frames=num_video_frames, image_only_indicator=image_only_indicator)
+        h = apply_control(h, control, 'middle')
+    else:
+        h = cached_features[1]
 
     for id, module in enumerate(self.output_blocks):
+        if id < len(self.output_blocks) - shallow_blocks:
+            if cached_features is not None:
+                continue
+        elif id == len(self.output_blocks) - shallow_blocks and cached_features is None and feature_cache is not None:
+            feature_cache[cache_key] = (diffusion_step, h)
+
         transformer_options["block"] = ("output", id)
         hsp = hs.pop()
         hsp = apply_control(hsp, control, 'output')
@@ -493,10 +589,15 @@ def patch_all():
     ldm_patched.modules.model_management.load_models_gpu = patched_load_models_gpu
     ldm_patched.modules.model_patcher.ModelPatcher.calculate_weight = calculate_weight_patched
     ldm_patched.controlnet.cldm.ControlNet.forward = patched_cldm_forward
-    ldm_patched.ldm.modules.diffusionmodules.openaimodel.UNetModel.forward = patched_unet_forward
+    if args_manager.args.compile_unet:
+        import torch._dynamo
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, compile_cache_size_limit)
+        ldm_patched.ldm.modules.diffusionmodules.openaimodel.UNetModel.forward = compiled_unet_forward
+    else:
+        ldm_patched.ldm.modules.diffusionmodules.openaimodel.UNetModel.forward = patched_unet_forward
     ldm_patched.modules.model_base.SDXL.encode_adm = sdxl_encode_adm_patched
     ldm_patched.modules.samplers.KSamplerX0Inpaint.forward = patched_KSamplerX0Inpaint_forward
-    ldm_patched.k_diffusion.sampling.BrownianTreeNoiseSampler = BrownianTreeNoiseSamplerPatched
+    ldm_patched.k_diffusion.sampling.BrownianTreeNoiseSampler = brownian_tree_noise_sampler
     ldm_patched.modules.samplers.sampling_function = patched_sampling_function
 
     warnings.filterwarnings(action='ignore', module='torchsde')
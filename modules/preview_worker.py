@@ -0,0 +1,72 @@
+import time
+import threading
+import torch
+
+import args_manager
+
+
+# Only the latest x0 is kept. Previews are rendered on this thread at most preview_fps times per second,
+# so the sampler never waits for a preview and steps nobody would see are never decoded.
+# The progress itself is reported by the sampler every step and carries the latest rendered preview,
+# so that consumers skipping queued progress entries never lose the image.
+preview_fps = max(float(args_manager.args.preview_fps), 0.1)
+pending = None
+latest_step = 0
+latest_preview = None
+generation = 0
+condition = threading.Condition()
+
+
+def submit(previewer, callback_function, step, x0, x, total_steps):
+    global pending, latest_step
+    with condition:
+        latest_step = step
+        pending = (generation, previewer, callback_function, step, x0, x, total_steps)
+        condition.notify()
+
+
+def get_latest_preview():
+    return latest_preview
+
+
+def flush():
+    global pending, generation, latest_preview
+    with condition:
+        pending = None
+        latest_preview = None
+        generation += 1
+
+
+@torch.inference_mode()
+def worker():
+    global pending, latest_preview
+    last_time = 0.0
+
+    while True:
+        with condition:
+            while pending is None:
+                condition.wait()
+            delay = last_time + 1.0 / preview_fps - time.perf_counter()
+            if delay <= 0:
+                task, pending = pending, None
+
+        if delay > 0:
+            time.sleep(delay)
+            continue
+
+        task_generation, previewer, callback_function, step, x0, x, total_steps = task
+        last_time = time.perf_counter()
+
+        try:
+            y = previewer(x0, step, total_steps)
+            with condition:
+                current = task_generation == generation
+                if current:
+                    latest_preview, step = y, latest_step
+            if current:
+                callback_function(step, x0, x, total_steps, y)
+        except Exception as e:
+            print(f'[Preview] Failed to render preview: {e}')
+
+
+threading.Thread(target=worker, daemon=True).start()
@@ -1,4 +1,5 @@
 import torch
+import hashlib
 import ldm_patched.modules.samplers
 import ldm_patched.modules.model_management
 
@@ -14,7 +15,11 @@ from ldm_patched.modules.samplers import resolve_areas_and_cond_masks, wrap_mode
 
 
 current_refiner = None
+# Samplers that build a BrownianTreeNoiseSampler when none is given.
+brownian_tree_samplers = ['sample_dpmpp_sde', 'sample_dpmpp_sde_gpu', 'sample_dpmpp_2m_sde', 'sample_dpmpp_2m_sde_gpu',
+                          'sample_dpmpp_3m_sde', 'sample_dpmpp_3m_sde_gpu']
 refiner_switch_step = -1
+sigmas_cache = {}
 
 
 @torch.no_grad()
@@ -83,6 +88,20 @@ def clip_separate_after_preparation(cond, target_model=None, target_clip=None):
     return results
 
 
+def has_same_weights(a, b):
+    # Clones share their patch tuples, so identical patches mean identical weights.
+    if a is b:
+        return True
+    if not a.is_clone(b) or a.patches.keys() != b.patches.keys():
+        return False
+    return all(len(a.patches[k]) == len(b.patches[k]) and all(x is y for x, y in zip(a.patches[k], b.patches[k]))
+               for k in a.patches)
+
+
+def is_model_loaded(patcher):
+    return any(has_same_weights(m.model, patcher) for m in ldm_patched.modules.model_management.current_loaded_models)
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def sample_hacked(model, noise, positive, negative, cfg, device, sampler, sigmas, model_options={}, latent_image=None, denoise_mask=None, callback=None, disable_pbar=False, seed=None):
@@ -118,49 +137,83 @@ def sample_hacked(model, noise, positive, negative, cfg, device, sampler, sigmas
     apply_empty_x_to_equal_area(list(filter(lambda c: c.get('control_apply_to_uncond', False) == True, positive)), negative, 'control', lambda cond_cnets, x: cond_cnets[x])
     apply_empty_x_to_equal_area(positive, negative, 'gligen', lambda cond_cnets, x: cond_cnets[x])
 
+    # Per-run options: the progress of every step is kept on the host, so that nothing reads it back from the
+    # device while sampling, the cond batching plan is computed on the first step only, the uncond cache
+    # holds the last uncond prediction for guidance reuse and the feature cache the deep UNet features.
+    model_options = {**model_options, 'transformer_options': {**model_options.get('transformer_options', {}), 'feature_cache': {}},
+                     'cond_batch_plan': {}, 'uncond_cache': {}}
+    diffusion_progress = (1.0 - model.model_sampling.timestep(sigmas).float() / 999.0).tolist()
+
     extra_args = {"cond":positive, "uncond":negative, "cond_scale": cfg, "model_options": model_options, "seed":seed}
 
-    if current_refiner is not None and hasattr(current_refiner.model, 'extra_conds'):
+    noise_sampler = model_options.get('noise_sampler', None)
+    if noise_sampler is not None and isinstance(sampler, ldm_patched.modules.samplers.KSAMPLER) \
+            and sampler.sampler_function.__name__ in brownian_tree_samplers:
+        sampler = ldm_patched.modules.samplers.KSAMPLER(
+            sampler.sampler_function, {**sampler.extra_options, 'noise_sampler': noise_sampler}, sampler.inpaint_options)
+
+    def set_diffusion_progress(step):
+        step = min(step, len(diffusion_progress) - 1)
+        extra_args['model_options']['transformer_options']['diffusion_progress'] = diffusion_progress[step]
+        extra_args['model_options']['transformer_options']['diffusion_step'] = step
+
+    if current_refiner is not None and current_refiner.model is model:
+        # The refiner shares the base model (synthetic refiner), so the prepared conds are already encoded for it.
+        positive_refiner = [{k: x[k] for k in ['model_conds', 'pooled_output'] if k in x} for x in positive]
+        negative_refiner = [{k: x[k] for k in ['model_conds', 'pooled_output'] if k in x} for x in negative]
+    elif current_refiner is not None and hasattr(current_refiner.model, 'extra_conds'):
         positive_refiner = clip_separate_after_preparation(positive, target_model=current_refiner.model)
         negative_refiner = clip_separate_after_preparation(negative, target_model=current_refiner.model)
 
         positive_refiner = encode_model_conds(current_refiner.model.extra_conds, positive_refiner, noise, device, "positive", latent_image=latent_image, denoise_mask=denoise_mask)
         negative_refiner = encode_model_conds(current_refiner.model.extra_conds, negative_refiner, noise, device, "negative", latent_image=latent_image, denoise_mask=denoise_mask)
 
+    if current_refiner is not None:
+        refiner_models, refiner_inference_memory = get_additional_models(positive_refiner, negative_refiner, current_refiner.model_dtype())
+        refiner_memory_required = model.memory_required([noise.shape[0] * 2] + list(noise.shape[1:])) + refiner_inference_memory
+
     def refiner_switch():
         cleanup_additional_models(set(get_models_from_cond(positive, "control") + get_models_from_cond(negative, "control")))
 
         extra_args["cond"] = positive_refiner
         extra_args["uncond"] = negative_refiner
 
-        # clear ip-adapter for refiner
-        extra_args['model_options'] = {k: {} if k == 'transformer_options' else v for k, v in extra_args['model_options'].items()}
+        # clear ip-adapter and the cached uncond of the base model for refiner,
+        # the refiner brings its own transformer patches (ToMe, HyperTile)
+        extra_args['model_options'] = {k: {} if k in ['transformer_options', 'uncond_cache'] else v for k, v in extra_args['model_options'].items()}
+        extra_args['model_options']['transformer_options'] = {**current_refiner.model_options.get('transformer_options', {}), 'feature_cache': {}}
 
-        models, inference_memory = get_additional_models(positive_refiner, negative_refiner, current_refiner.model_dtype())
-        ldm_patched.modules.model_management.load_models_gpu(
-            [current_refiner] + models,
-            model.memory_required([noise.shape[0] * 2] + list(noise.shape[1:])) + inference_memory)
+        # Nothing to load when the refiner weights are already on the device, e.g. a synthetic refiner without extra patches.
+        if len(refiner_models) > 0 or not is_model_loaded(current_refiner):
+            ldm_patched.modules.model_management.load_models_gpu([current_refiner] + refiner_models, refiner_memory_required)
+            print('Refiner Swapped')
+        else:
+            print('Refiner Swapped (weights shared with the base model)')
 
         model_wrap.inner_model = current_refiner.model
-        print('Refiner Swapped')
         return
 
     def callback_wrap(step, x0, x, total_steps):
         if step == refiner_switch_step and current_refiner is not None:
             refiner_switch()
+        # The callback follows the first model call of a step. Samplers that call the model again within the step
+        # (second order, SDE midpoints) therefore already see the progress of the next step for those calls,
+        # telling them apart would need the sigma of each call read back from the device.
+        set_diffusion_progress(step + 1)
         if callback is not None:
             # residual_noise_preview = x - x0
             # residual_noise_preview /= residual_noise_preview.std()
             # residual_noise_preview *= x0.std()
             callback(step, x0, x, total_steps)
 
+    set_diffusion_progress(0)
     samples = sampler.sample(model_wrap, sigmas, extra_args, callback_wrap, noise, latent_image, denoise_mask, disable_pbar)
     return model.process_latent_out(samples.to(torch.float32))
 
 
 @torch.no_grad()
 @torch.inference_mode()
-def calculate_sigmas_scheduler_hacked(model, scheduler_name, steps):
+def calculate_sigmas_scheduler_uncached(model, scheduler_name, steps):
     if scheduler_name == "karras":
         sigmas = k_diffusion_sampling.get_sigmas_karras(n=steps, sigma_min=float(model.model_sampling.sigma_min), sigma_max=float(model.model_sampling.sigma_max))
     elif scheduler_name == "exponential":
@@ -180,5 +233,26 @@ def calculate_sigmas_scheduler_hacked(model, scheduler_name, steps):
     return sigmas
 
 
+def get_model_sampling_signature(model_sampling):
+    # The schedulers read the whole sigma table, so the signature hashes all of it.
+    # It is recomputed whenever the table is replaced (set_sigmas, device moves).
+    sigmas = model_sampling.sigmas
+    cached = getattr(model_sampling, 'sigmas_signature', None)
+    if cached is None or cached[0] is not sigmas:
+        digest = hashlib.sha1(sigmas.detach().float().cpu().numpy().tobytes()).hexdigest()
+        cached = (sigmas, (type(model_sampling).__name__, digest))
+        model_sampling.sigmas_signature = cached
+    return cached[1]
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def calculate_sigmas_scheduler_hacked(model, scheduler_name, steps):
+    key = (get_model_sampling_signature(model.model_sampling), scheduler_name, steps)
+    if key not in sigmas_cache:
+        sigmas_cache[key] = calculate_sigmas_scheduler_uncached(model, scheduler_name, steps).cpu()
+    return sigmas_cache[key].clone()
+
+
 ldm_patched.modules.samplers.calculate_sigmas_scheduler = calculate_sigmas_scheduler_hacked
 ldm_patched.modules.samplers.sample = sample_hacked
@@ -23,7 +23,41 @@ def normalize_key(k):
     return k
 
 
+def compile_style(prompt, negative_prompt):
+    # positive lines are pre-split around the prompt slot, so applying a style is only a join per line
+    return [line.split('{prompt}') for line in prompt.splitlines()], negative_prompt.splitlines()
+
+
+def get_styles_signature(files):
+    signature = []
+    for styles_file in files:
+        try:
+            stat = os.stat(os.path.join(styles_path, styles_file))
+            signature.append([styles_file, stat.st_mtime, stat.st_size])
+        except OSError:
+            signature.append([styles_file, None, None])
+    return signature
+
+
+def load_styles_from_files(files):
+    results = {}
+    for styles_file in files:
+        try:
+            with open(os.path.join(styles_path, styles_file), encoding='utf-8') as f:
+                for entry in json.load(f):
+                    name = normalize_key(entry['name'])
+                    prompt = entry['prompt'] if 'prompt' in entry else ''
+                    negative_prompt = entry['negative_prompt'] if 'negative_prompt' in entry else ''
+                    results[name] = (prompt, negative_prompt)
+        except Exception as e:
+            print(str(e))
+            print(f'Failed to load style file {styles_file}')
+    return results
+
+
 styles = {}
+compiled_styles = {}
+styles_cache_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../compiled_styles.json'))
 
 styles_files = get_files_from_folder(styles_path, ['.json'])
 
@@ -37,17 +71,34 @@ for x in ['sdxl_styles_fooocus.json',
         styles_files.remove(x)
         styles_files.append(x)
 
-for styles_file in styles_files:
-    try:
-        with open(os.path.join(styles_path, styles_file), encoding='utf-8') as f:
-            for entry in json.load(f):
-                name = normalize_key(entry['name'])
-                prompt = entry['prompt'] if 'prompt' in entry else ''
-                negative_prompt = entry['negative_prompt'] if 'negative_prompt' in entry else ''
+styles_signature = get_styles_signature(styles_files)
+
+try:
+    if os.path.exists(styles_cache_path):
+        with open(styles_cache_path, encoding='utf-8') as f:
+            styles_cache = json.load(f)
+        if styles_cache['signature'] == styles_signature:
+            for name, prompt, negative_prompt, positive_lines, negative_lines in styles_cache['styles']:
                 styles[name] = (prompt, negative_prompt)
+                compiled_styles[name] = (positive_lines, negative_lines)
+except Exception as e:
+    print('Load compiled styles failed.')
+    print(e)
+    styles, compiled_styles = {}, {}
+
+if len(styles) == 0:
+    styles = load_styles_from_files(styles_files)
+    compiled_styles = {name: compile_style(prompt, negative_prompt) for name, (prompt, negative_prompt) in styles.items()}
+    try:
+        with open(styles_cache_path, 'wt', encoding='utf-8') as f:
+            json.dump({
+                'signature': styles_signature,
+                'styles': [[name, prompt, negative_prompt] + list(compiled_styles[name])
+                           for name, (prompt, negative_prompt) in styles.items()]
+            }, f)
     except Exception as e:
-        print(str(e))
-        print(f'Failed to load style file {styles_file}')
+        print('Write compiled styles failed.')
+        print(e)
 
 style_keys = list(styles.keys())
 fooocus_expansion = "Fooocus V2"
@@ -55,28 +106,98 @@ legal_style_names = [fooocus_expansion] + style_keys
 
 
 def apply_style(style, positive):
-    p, n = styles[style]
-    return p.replace('{prompt}', positive).splitlines(), n.splitlines()
+    positive_lines, negative_lines = compiled_styles[style]
+
+    if positive != ''.join(positive.splitlines()):
+        # the prompt itself has line breaks, which must split the style lines
+        p, n = styles[style]
+        return p.replace('{prompt}', positive).splitlines(), n.splitlines()
+
+    return [positive.join(segments) for segments in positive_lines], list(negative_lines)
+
+
+wildcards_pattern = re.compile(r'__([\w-]+)__')
+wildcards = {}
+
+
+def load_wildcard_words(filename):
+    try:
+        with open(filename, encoding='utf-8') as f:
+            words = [x for x in f.read().splitlines() if x != '']
+    except:
+        words = []
+    return words, any('_' in w for w in words)
+
+
+def refresh_wildcards(directory=wildcards_path):
+    global wildcards
+
+    previous = wildcards.get(directory, {})
+    current = {}
+
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        entries = []
+
+    for entry in entries:
+        name, extension = os.path.splitext(entry.name)
+        if extension != '.txt' or not entry.is_file():
+            continue
+
+        mtime = entry.stat().st_mtime
+        if name in previous and previous[name][0] == mtime:
+            current[name] = previous[name]
+        else:
+            current[name] = (mtime, *load_wildcard_words(entry.path))
+
+    wildcards[directory] = current
+    return current
+
+
+def get_wildcard_words(placeholder, directory=wildcards_path):
+    index = wildcards.get(directory, None)
+    if index is None:
+        index = refresh_wildcards(directory)
+
+    if placeholder in index:
+        return index[placeholder][1:]
+
+    # not indexed, e.g. created after the last refresh or matched case-insensitively by the file system
+    return load_wildcard_words(os.path.join(directory, f'{placeholder}.txt'))
 
 
 def apply_wildcards(wildcard_text, rng, directory=wildcards_path):
     for _ in range(wildcards_max_bfs_depth):
-        placeholders = re.findall(r'__([\w-]+)__', wildcard_text)
+        placeholders = wildcards_pattern.findall(wildcard_text)
         if len(placeholders) == 0:
             return wildcard_text
 
         print(f'[Wildcards] processing: {wildcard_text}')
+        words = {}
+        underscored = False
         for placeholder in placeholders:
-            try:
-                words = open(os.path.join(directory, f'{placeholder}.txt'), encoding='utf-8').read().splitlines()
-                words = [x for x in words if x != '']
-                assert len(words) > 0
-                wildcard_text = wildcard_text.replace(f'__{placeholder}__', rng.choice(words), 1)
-            except:
-                print(f'[Wildcards] Warning: {placeholder}.txt missing or empty. '
-                      f'Using "{placeholder}" as a normal word.')
-                wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
-            print(f'[Wildcards] {wildcard_text}')
+            if placeholder not in words:
+                words[placeholder], placeholder_underscored = get_wildcard_words(placeholder, directory)
+                underscored = underscored or placeholder_underscored
+                if len(words[placeholder]) == 0:
+                    print(f'[Wildcards] Warning: {placeholder}.txt missing or empty. '
+                          f'Using "{placeholder}" as a normal word.')
+
+        # When the only underscores are the placeholder delimiters and no candidate word brings new ones,
+        # replacing the first occurrence of each placeholder in turn is the same as one left-to-right substitution.
+        if not underscored and wildcard_text.count('_') == 4 * len(placeholders):
+            wildcard_text = wildcards_pattern.sub(
+                lambda m: rng.choice(words[m.group(1)]) if len(words[m.group(1)]) > 0 else m.group(1),
+                wildcard_text)
+        else:
+            for placeholder in placeholders:
+                if len(words[placeholder]) > 0:
+                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', rng.choice(words[placeholder]), 1)
+                else:
+                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
+
+        print(f'[Wildcards] {wildcard_text}')
 
     print(f'[Wildcards] BFS stack overflow. Current text: {wildcard_text}')
     return wildcard_text
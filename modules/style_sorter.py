@@ -51,9 +51,46 @@ def localization_key(x):
     return x + localization.current_translation.get(x, '')
 
 
+search_keys = {}
+search_trigrams = {}
+search_index_translation = None
+
+
+def refresh_search_index():
+    global search_keys, search_trigrams, search_index_translation
+
+    if search_index_translation is localization.current_translation and len(search_keys) == len(all_styles) \
+            and all(y in search_keys for y in all_styles):
+        return
+
+    search_keys = {y: localization_key(y).lower() for y in all_styles}
+    search_trigrams = {}
+    for y, key in search_keys.items():
+        for i in range(len(key) - 2):
+            search_trigrams.setdefault(key[i:i + 3], set()).add(y)
+    search_index_translation = localization.current_translation
+    return
+
+
+def match_styles(query):
+    refresh_search_index()
+    query = query.lower()
+
+    if len(query) < 3:
+        return {y for y, key in search_keys.items() if query in key}
+
+    postings = sorted([search_trigrams.get(query[i:i + 3], set()) for i in range(len(query) - 2)], key=len)
+    candidates = set.intersection(*postings)
+    return {y for y in candidates if query in search_keys[y]}
+
+
 def search_styles(selected, query):
     unselected = [y for y in all_styles if y not in selected]
-    matched = [y for y in unselected if query.lower() in localization_key(y).lower()] if len(query.replace(' ', '')) > 0 else []
+    if len(query.replace(' ', '')) > 0:
+        matched_styles = match_styles(query)
+        matched = [y for y in unselected if y in matched_styles]
+    else:
+        matched = []
     unmatched = [y for y in unselected if y not in matched]
     sorted_styles = matched + selected + unmatched
     return gr.CheckboxGroup.update(choices=sorted_styles)
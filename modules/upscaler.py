@@ -1,34 +1,136 @@
 import os
 import torch
 import modules.core as core
+import modules.flags
+import modules.config
+import ldm_patched.modules.model_management as model_management
+import ldm_patched.modules.utils
 
+from ldm_patched.pfn import model_loading
 from ldm_patched.pfn.architecture.RRDB import RRDBNet as ESRGAN
-from ldm_patched.contrib.external_upscale_model import ImageUpscaleWithModel
+from ldm_patched.modules.model_patcher import ModelPatcher
 from collections import OrderedDict
 from modules.config import path_upscale_models
 
 model_filename = os.path.join(path_upscale_models, 'fooocus_upscaler_s409985e5.bin')
-opImageUpscaleWithModel = ImageUpscaleWithModel()
 model = None
+models = {}
 
+tile_sizes = [1024, 768, 512, 384, 256, 128]
+min_tile_size = 64  # smallest tile tried after an OOM, it must stay above the overlap
+tile_overlap = 32
 
-def perform_upscale(img):
-    global model
-
-    print(f'Upscaling image with shape {str(img.shape)} ...')
 
-    if model is None:
-        sd = torch.load(model_filename)
+def load_network(name):
+    if name == modules.flags.upscale_model_default:
+        sd = torch.load(model_filename, map_location='cpu')
         sdo = OrderedDict()
         for k, v in sd.items():
             sdo[k.replace('residual_block_', 'RDB')] = v
         del sd
-        model = ESRGAN(sdo)
-        model.cpu()
-        model.eval()
+        return ESRGAN(sdo)
+
+    # Any architecture known to pfn: SRVGG (Real-ESRGAN compact), SwinIR, Swin2SR, HAT, DAT, OmniSR, SPSR, ...
+    sd = ldm_patched.modules.utils.load_torch_file(os.path.join(path_upscale_models, name), safe_load=True)
+    if "module.layers.0.residual_group.blocks.0.norm1.weight" in sd:
+        sd = ldm_patched.modules.utils.state_dict_prefix_replace(sd, {"module.": ""})
+    return model_loading.load_state_dict(sd)
+
+
+def load_upscaler(name=None):
+    global model
+
+    if name is None:
+        name = modules.flags.upscale_model_default
+
+    if name not in modules.config.upscale_model_filenames:
+        print(f'[Upscaler] Unknown upscale model {name}, using {modules.flags.upscale_model_default}.')
+        name = modules.flags.upscale_model_default
+
+    if name not in models:
+        # Besides the default model, only the last chosen one stays cached.
+        for k in [k for k in models if k != modules.flags.upscale_model_default]:
+            model_management.unload_model_clones(models.pop(k))
+
+        network = load_network(name)
+        network.eval()
+        print(f'Upscale model loaded: {name} ({type(network).__name__}, {network.scale}x)')
+        models[name] = ModelPatcher(network, load_device=model_management.get_torch_device(),
+                                    offload_device=model_management.unet_offload_device())
+
+    model = models[name]
+    model_management.load_model_gpu(model)
+    return model
+
+
+def get_tile_plan(height, width, scale, device):
+    # Same per pixel estimate as the upscale node of ComfyUI, the output buffers are reserved first.
+    memory_per_pixel = 3 * 4 * max(scale, 1) * 384.0
+    free_memory = model_management.get_free_memory(device) - 4 * 4 * height * width * scale * scale
+
+    for tile in tile_sizes:
+        tile_height, tile_width = min(tile, height), min(tile, width)
+        tile_memory = tile_height * tile_width * memory_per_pixel
+        if tile_memory <= free_memory or tile == tile_sizes[-1]:
+            return tile_height, tile_width, max(1, int(free_memory // tile_memory))
+
+
+def get_tile_positions(length, tile, overlap):
+    # All tiles have the same size, so that they can be batched; the last one is aligned to the border.
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, tile - overlap)) + [length - tile]
+
+
+def upscale_tiles(network, x, scale, tile_height, tile_width, batch_size):
+    height, width = x.shape[2], x.shape[3]
+
+    # Full size float buffers, released as soon as the result is on the host.
+    out = torch.zeros((3, height * scale, width * scale), device=x.device)
+    weight = torch.zeros((1, height * scale, width * scale), device=x.device)
+    window = ldm_patched.modules.utils.get_tiled_scale_window(
+        tile_height * scale, tile_width * scale, tile_overlap * scale, x.device)[0]
+
+    positions = [(y, x0) for y in get_tile_positions(height, tile_height, tile_overlap)
+                 for x0 in get_tile_positions(width, tile_width, tile_overlap)]
+    pbar = ldm_patched.modules.utils.ProgressBar(len(positions))
+
+    for i in range(0, len(positions), batch_size):
+        batch = positions[i:i + batch_size]
+        tiles = torch.cat([x[:, :, y:y + tile_height, x0:x0 + tile_width] for y, x0 in batch])
+        for (y, x0), result in zip(batch, network(tiles)):
+            out[:, y * scale:(y + tile_height) * scale, x0 * scale:(x0 + tile_width) * scale] += result * window
+            weight[:, y * scale:(y + tile_height) * scale, x0 * scale:(x0 + tile_width) * scale] += window
+        pbar.update(len(batch))
+
+    img = out.div_(weight).mul_(255.0).clamp_(min=0.0, max=255.0).to(torch.uint8)
+    return img.movedim(0, -1).cpu().numpy()
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def perform_upscale(img, model_name=None):
+    print(f'Upscaling image with shape {str(img.shape)} ...')
+
+    upscaler = load_upscaler(model_name)
+    network = upscaler.model
+    device = upscaler.load_device
+    scale = int(network.scale)
 
-    img = core.numpy_to_pytorch(img)
-    img = opImageUpscaleWithModel.upscale(model, img)[0]
-    img = core.pytorch_to_numpy(img)[0]
+    x = core.numpy_to_pytorch(img).movedim(-1, 1).to(device)
+    tile_height, tile_width, batch_size = get_tile_plan(x.shape[2], x.shape[3], scale, device)
 
-    return img
+    # The plan is an estimate made for ESRGAN, other architectures may need more: retry smaller after an OOM.
+    while True:
+        try:
+            return upscale_tiles(network, x, scale, tile_height, tile_width, batch_size)
+        except model_management.OOM_EXCEPTION as e:
+            model_management.soft_empty_cache()
+            if batch_size > 1:
+                batch_size = 1
+            elif max(tile_height, tile_width) > min_tile_size:
+                tile_height, tile_width = [max(t // 2, min_tile_size) if t > min_tile_size else t
+                                           for t in (tile_height, tile_width)]
+            else:
+                raise e
+            print(f'[Upscaler] Out of memory, retrying with {tile_height}x{tile_width} tiles in batches of {batch_size}.')
@@ -93,12 +93,9 @@ def get_image_shape_ceil(im):
     return get_shape_ceil(H, W)
 
 
-def set_image_shape_ceil(im, shape_ceil):
+def get_size_for_shape_ceil(H, W, shape_ceil):
     shape_ceil = float(shape_ceil)
 
-    H_origin, W_origin, _ = im.shape
-    H, W = H_origin, W_origin
-    
     for _ in range(256):
         current_shape_ceil = get_shape_ceil(H, W)
         if abs(current_shape_ceil - shape_ceil) < 0.1:
@@ -107,6 +104,13 @@ def set_image_shape_ceil(im, shape_ceil):
         H = int(round(float(H) * k / 64.0) * 64)
         W = int(round(float(W) * k / 64.0) * 64)
 
+    return H, W
+
+
+def set_image_shape_ceil(im, shape_ceil):
+    H_origin, W_origin, _ = im.shape
+    H, W = get_size_for_shape_ceil(H_origin, W_origin, shape_ceil)
+
     if H == H_origin and W == W_origin:
         return im
 
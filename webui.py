@@ -407,6 +407,10 @@ with shared.gradio_root:
                                 uov_input_image = grh.Image(label='Drag above image to here', source='upload', type='numpy')
                             with gr.Column():
                                 uov_method = gr.Radio(label='Upscale or Variation:', choices=flags.uov_list, value=flags.disabled)
+                                upscale_model = gr.Dropdown(label='Upscale Model', choices=modules.config.upscale_model_filenames,
+                                                            value=flags.upscale_model_default)
+                                latent_upscale_method = gr.Dropdown(label='Latent Upscale', choices=flags.latent_upscale_methods,
+                                                                    value=flags.disabled)
                                 gr.HTML('<a href="https://github.com/lllyasviel/Fooocus/discussions/390" target="_blank">\U0001F4D4 Document</a>')
                     with gr.TabItem(label='Image Prompt') as ip_tab:
                         with gr.Row():
@@ -614,6 +618,17 @@ with shared.gradio_root:
                                                  value=modules.config.default_cfg_tsnr,
                                                  info='Enabling Fooocus\'s implementation of CFG mimicking for TSNR '
                                                       '(effective when real CFG > mimicked CFG).')
+                        cfg_skip_after = gr.Slider(label='Skip Negative Guidance After', minimum=0.0, maximum=1.0,
+                                                   step=0.001, value=1.0,
+                                                   info='Skip the negative prompt in late steps (use 1.0 to disable).')
+                        cfg_reuse_interval = gr.Slider(label='Negative Guidance Reuse Interval', minimum=1, maximum=8,
+                                                       step=1, value=1,
+                                                       info='Evaluate the negative prompt every N steps (use 1 to disable).')
+                        sharpness_end = gr.Slider(label='Sharpness End At Step', minimum=0.0, maximum=1.0,
+                                                  step=0.001, value=1.0,
+                                                  info='When to stop applying sharpness (use 1.0 to disable).')
+                        guidance_ctrls = [cfg_skip_after, cfg_reuse_interval, sharpness_end]
+
                         sampler_name = gr.Dropdown(label='Sampler', choices=flags.sampler_list,
                                                    value=modules.config.default_sampler)
                         scheduler_name = gr.Dropdown(label='Scheduler', choices=flags.scheduler_list,
@@ -647,6 +662,9 @@ with shared.gradio_root:
                                                                info='Set as negative number to disable. For developer debugging.')
                         disable_preview = gr.Checkbox(label='Disable Preview', value=False,
                                                       info='Disable preview during generation.')
+                        preview_method = gr.Radio(label='Preview Method', choices=flags.preview_methods,
+                                                  value=modules.config.default_preview_method,
+                                                  info='Backend used to render previews during generation.')
 
                     with gr.Tab(label='Control'):
                         debugging_cn_preprocessor = gr.Checkbox(label='Debug Preprocessors', value=False,
@@ -712,6 +730,22 @@ with shared.gradio_root:
                         freeu_s2 = gr.Slider(label='S2', minimum=0, maximum=4, step=0.01, value=0.95)
                         freeu_ctrls = [freeu_enabled, freeu_b1, freeu_b2, freeu_s1, freeu_s2]
 
+                    with gr.Tab(label='Speed-up'):
+                        tome_ratio = gr.Slider(label='Token Merging Ratio', minimum=0.0, maximum=0.9, step=0.01,
+                                               value=0.0, info='Merge similar tokens in self-attention (use 0.0 to disable).')
+                        hypertile_enabled = gr.Checkbox(label='HyperTile', value=False,
+                                                        info='Split self-attention into tiles (ignored when Token Merging is enabled).')
+                        hypertile_tile_size = gr.Slider(label='HyperTile Tile Size', minimum=32, maximum=2048, step=32,
+                                                        value=256)
+                        hypertile_max_depth = gr.Slider(label='HyperTile Max Depth', minimum=0, maximum=3, step=1,
+                                                        value=0)
+                        deep_cache_interval = gr.Slider(label='Deep Cache Interval', minimum=-1, maximum=10, step=1,
+                                                        value=-1, info='Run the full UNet every N steps (-1 for the performance default, 1 to disable).')
+                        deep_cache_depth = gr.Slider(label='Deep Cache Depth', minimum=-1, maximum=8, step=1,
+                                                     value=-1, info='Shallow blocks recomputed on cached steps (-1 for the performance default).')
+                        speedup_ctrls = [tome_ratio, hypertile_enabled, hypertile_tile_size, hypertile_max_depth,
+                                         deep_cache_interval, deep_cache_depth]
+
                 adps = [disable_preview, adm_scaler_positive, adm_scaler_negative, adm_scaler_end, adaptive_cfg, sampler_name,
                         scheduler_name, generate_image_grid, overwrite_step, overwrite_switch, overwrite_width, overwrite_height,
                         overwrite_vary_strength, overwrite_upscale_strength,
@@ -720,6 +754,9 @@ with shared.gradio_root:
                         canny_low_threshold, canny_high_threshold, refiner_swap_method]
                 adps += freeu_ctrls
                 adps += inpaint_ctrls
+                adps += guidance_ctrls
+                adps += speedup_ctrls
+                adps += [preview_method, upscale_model, latent_upscale_method]
 
                 def dev_mode_checked(r):
                     return gr.update(visible=r)
@@ -734,9 +771,10 @@ with shared.gradio_root:
                     results += [gr.update(choices=modules.config.model_filenames), gr.update(choices=['None'] + modules.config.model_filenames)]
                     for i in range(5):
                         results += [gr.update(choices=['None'] + modules.config.lora_filenames), gr.update()]
+                    results += [gr.update(choices=modules.config.upscale_model_filenames)]
                     return results
 
-                model_refresh.click(model_refresh_clicked, [], [base_model, refiner_model] + lora_ctrls,
+                model_refresh.click(model_refresh_clicked, [], [base_model, refiner_model] + lora_ctrls + [upscale_model],
                                     queue=False, show_progress=False)
 
         performance_selection.change(lambda x: [gr.update(interactive=x != 'Extreme Speed')] * 11 +